@@ -2,22 +2,40 @@
 Core de agentes: system prompts, tool dispatch, streaming via SSE.
 """
 
+import functools
 import json
 import os
+import threading
 import uuid
 from datetime import datetime
 
-import anthropic
-
-from db import get_db
+from db import get_db, writer
+from auth import assinar_exportacao, EXPORT_TTL
+from archive import restaurar_conversa
+import dashboards
+import cache
 from tools import (
-    contar_defeitos, top_defeitos, defeitos_por_turno,
+    contar_defeitos, top_defeitos, defeitos_por_turno, exportar_defeitos,
     gerar_grafico, gerar_tabela, gerar_kpi, gerar_dashboard,
 )
 
 MODEL = os.environ.get("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
 
-client = anthropic.AsyncAnthropic()
+# O SDK da Anthropic demora ~1.4 s a importar: só é carregado (e o cliente criado)
+# no primeiro uso, ou em background depois do arranque (ver server.startup).
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                import anthropic
+
+                client = anthropic.AsyncAnthropic()
+    return client
 
 # --- Mapa de tools disponíveis ---
 
@@ -25,6 +43,7 @@ TOOL_MAP = {
     "contar_defeitos": contar_defeitos,
     "top_defeitos": top_defeitos,
     "defeitos_por_turno": defeitos_por_turno,
+    "exportar_defeitos": exportar_defeitos,
     "gerar_grafico": gerar_grafico,
     "gerar_tabela": gerar_tabela,
     "gerar_kpi": gerar_kpi,
@@ -33,6 +52,8 @@ TOOL_MAP = {
 
 RENDER_TOOLS = {"gerar_grafico", "gerar_tabela", "gerar_kpi", "gerar_dashboard"}
 
+DATA_TOOLS = {"contar_defeitos", "top_defeitos", "defeitos_por_turno"}  # Podem alimentar widgets vivos
+
 TOOL_DEFINITIONS = {
     "contar_defeitos": {
         "name": "contar_defeitos",
@@ -73,6 +94,35 @@ TOOL_DEFINITIONS = {
             },
         },
     },
+    "exportar_defeitos": {
+        "name": "exportar_defeitos",
+        "description": (
+            "Exporta os registos de defeitos (filtrados) ou as contagens por grupo para um ficheiro CSV/NDJSON "
+            "e devolve um link de download válido durante alguns minutos. Usa quando o utilizador pede os dados em bruto, "
+            "uma listagem longa ou um ficheiro — os dados não passam pela conversa, só o link. "
+            "Colunas: id, data, turno, operador, tipo_defeito, material, rack, posicao."
+        ),
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "formato": {"type": "string", "enum": ["csv", "ndjson"], "description": "Formato do ficheiro (por omissão csv)."},
+                "filtros": {
+                    "type": "object",
+                    "description": "Filtros por coluna: valor ou lista de valores aceites (ex: {\"turno\": \"noite\", \"tipo_defeito\": [\"lixo\", \"crateras\"]}).",
+                    "additionalProperties": {
+                        "anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}],
+                    },
+                },
+                "agrupar": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Colunas para agrupar: em vez das linhas, exporta o total de cada combinação (ex: [\"tipo_defeito\", \"material\"]).",
+                },
+                "data_de": {"type": "string", "description": "Data inicial inclusiva (AAAA-MM-DD)."},
+                "data_ate": {"type": "string", "description": "Data final inclusiva (AAAA-MM-DD)."},
+            },
+        },
+    },
     "gerar_grafico": {
         "name": "gerar_grafico",
         "description": "Gera um gráfico visual no chat. Usa DEPOIS de consultar dados com as outras ferramentas. Tipos: bar, pie, line, doughnut.",
@@ -144,7 +194,12 @@ TOOL_DEFINITIONS = {
             "Gera um dashboard HTML completo acessível por link. Usa quando o utilizador pede um relatório, "
             "dashboard ou análise visual completa. O HTML é inserido num template que já inclui Chart.js e estilos base. "
             "Escreve apenas o conteúdo do body: divs, canvas para gráficos (com <script>new Chart(...)</script>), "
-            "tabelas e KPIs. Classes CSS disponíveis: .kpi-card, .chart-container, .data-table, .dashboard-grid, .dashboard-row."
+            "tabelas e KPIs. Classes CSS disponíveis: .kpi-card, .chart-container, .data-table, .dashboard-grid, .dashboard-row. "
+            "Dashboards vivos (recomendado): em vez de escrever os números no HTML, declara em `widgets` a consulta por trás "
+            "de cada valor ({id, tool, args}, com tool em contar_defeitos, top_defeitos, defeitos_por_turno). "
+            "Os valores são recalculados sempre que o dashboard é aberto: usa <span data-qhub-widget='id' "
+            "data-qhub-campo='total'></span> para valores simples e QHUB.on('id', function (r) { ... }) nos scripts "
+            "de gráficos, onde r é o resultado da tool."
         ),
         "input_schema": {
             "type": "object",
@@ -154,6 +209,19 @@ TOOL_DEFINITIONS = {
                     "type": "string",
                     "description": "Conteúdo HTML do body do dashboard. Pode incluir <canvas> + <script> para Chart.js, tabelas, KPIs, etc.",
                 },
+                "widgets": {
+                    "type": "array",
+                    "description": "Consultas que alimentam o dashboard (opcional). Cada resultado fica disponível pelo id.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string", "description": "Identificador usado no HTML (data-qhub-widget / QHUB.on)."},
+                            "tool": {"type": "string", "enum": sorted(DATA_TOOLS)},
+                            "args": {"type": "object", "description": "Argumentos da tool (ex: {\"n\": 5})."},
+                        },
+                        "required": ["id", "tool"],
+                    },
+                },
             },
             "required": ["titulo", "html"],
         },
@@ -163,6 +231,39 @@ TOOL_DEFINITIONS = {
 MAX_HISTORY = 20  # Últimas N mensagens a enviar ao modelo
 
 
+@functools.lru_cache(maxsize=64)
+def tool_definitions(nomes: tuple) -> list[dict]:
+    """Lista de definições enviada ao modelo, construída uma vez por conjunto de tools."""
+    return [TOOL_DEFINITIONS[t] for t in nomes if t in TOOL_DEFINITIONS]
+
+
+def validar_widgets(widgets) -> list[dict]:
+    """Mantém só widgets com tool de dados conhecida e argumentos do seu schema."""
+    validos = []
+    for w in widgets or []:
+        if not isinstance(w, dict) or w.get("tool") not in DATA_TOOLS or not w.get("id"):
+            continue
+        props = TOOL_DEFINITIONS[w["tool"]]["input_schema"]["properties"]
+        args = w.get("args") or {}
+        validos.append({
+            "id": str(w["id"]),
+            "tool": w["tool"],
+            "args": {k: v for k, v in args.items() if k in props} if isinstance(args, dict) else {},
+        })
+    return validos
+
+
+def avaliar_widgets(widgets: list[dict]) -> dict:
+    """Corre as consultas dos widgets (agregados em cache, sem modelo)."""
+    dados = {}
+    for w in widgets:
+        try:
+            dados[w["id"]] = TOOL_MAP[w["tool"]](**w["args"])
+        except Exception as e:
+            dados[w["id"]] = {"error": str(e)}
+    return dados
+
+
 async def process_message(user_id: int, conversa_id: int, user_message: str):
     """
     Processa uma mensagem do utilizador.
@@ -170,9 +271,13 @@ async def process_message(user_id: int, conversa_id: int, user_message: str):
     """
     conn = get_db()
 
-    # Validar conversa
+    # Validar conversa (traz a versão da cache de agentes e o estado de arquivo na mesma query)
     conversa = conn.execute(
-        "SELECT * FROM conversas WHERE id = ? AND user_id = ?",
+        f"""
+        SELECT c.*, ({cache.VERSAO_SQL}) AS cache_versao,
+               EXISTS (SELECT 1 FROM mensagens_arquivo a WHERE a.conversa_id = c.id) AS arquivada
+        FROM conversas c WHERE c.id = ? AND c.user_id = ?
+        """,
         (conversa_id, user_id),
     ).fetchone()
     if not conversa:
@@ -180,18 +285,20 @@ async def process_message(user_id: int, conversa_id: int, user_message: str):
         yield f'data: {json.dumps({"type": "error", "content": "Conversa não encontrada"})}\n\n'
         return
 
-    # Carregar agente
-    agente = conn.execute(
-        "SELECT * FROM agentes WHERE id = ?", (conversa["agente_id"],)
-    ).fetchone()
+    # Carregar agente (da cache; só vai à DB se a versão mudou)
+    agente = cache.agentes.agente(conn, conversa["agente_id"], versao=conversa["cache_versao"])
+
+    # Conversa arquivada volta à tabela quente antes de continuar
+    if conversa["arquivada"]:
+        restaurar_conversa(conn, conversa_id)
 
     # Guardar mensagem do user
+    # (o await só volta depois do commit, por isso o histórico já a inclui)
     now = datetime.utcnow().isoformat()
-    conn.execute(
+    await writer.execute(
         "INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
         (conversa_id, "user", user_message, now),
     )
-    conn.commit()
 
     # Carregar histórico
     rows = conn.execute(
@@ -203,8 +310,9 @@ async def process_message(user_id: int, conversa_id: int, user_message: str):
     messages = [{"role": r["role"], "content": r["content"]} for r in rows]
 
     # Tools permitidas para este agente
-    allowed = json.loads(agente["tools"])
-    tools = [TOOL_DEFINITIONS[t] for t in allowed if t in TOOL_DEFINITIONS]
+    tools = tool_definitions(agente["tools"])
+
+    import anthropic  # Normalmente já carregado em background (ver get_client)
 
     # Loop de tool use
     full_text = ""
@@ -212,9 +320,10 @@ async def process_message(user_id: int, conversa_id: int, user_message: str):
     response = None
 
     try:
+        api = get_client()
         for _ in range(max_iterations):
             # Stream da resposta
-            async with client.messages.stream(
+            async with api.messages.stream(
                 model=MODEL,
                 max_tokens=4096,
                 system=agente["system_prompt"],
@@ -262,15 +371,25 @@ async def process_message(user_id: int, conversa_id: int, user_message: str):
                     # Guardar dashboard na DB e devolver URL
                     dash_id = uuid.uuid4().hex[:12]
                     now_d = datetime.utcnow().isoformat()
-                    conn.execute(
-                        "INSERT INTO dashboards (id, user_id, titulo, html, created_at) VALUES (?, ?, ?, ?, ?)",
-                        (dash_id, user_id, result["titulo"], result["html"], now_d),
+                    widgets = validar_widgets(result.get("widgets"))
+                    await writer.execute(
+                        "INSERT INTO dashboards (id, user_id, titulo, html, created_at, widgets) VALUES (?, ?, ?, ?, ?, ?)",
+                        (dash_id, user_id, result["titulo"], result["html"], now_d,
+                         json.dumps(widgets, ensure_ascii=False) if widgets else None),
+                    )
+                    await dashboards.guardar_pagina(
+                        writer, dash_id, result["titulo"], result["html"], now_d, live=bool(widgets)
                     )
-                    conn.commit()
                     url = f"/dashboards/{dash_id}"
                     yield f'data: {json.dumps({"type": "dashboard", "url": url, "titulo": result["titulo"]}, ensure_ascii=False)}\n\n'
                     # Override result para o tool_result que volta ao Claude
                     result = {"status": "ok", "url": url}
+                elif tu.name == "exportar_defeitos" and "error" not in result:
+                    # Link assinado para o download; o modelo só vê o link
+                    url = f"/defeitos/export/{assinar_exportacao(user_id, result['pedido'])}"
+                    pedido = result["pedido"]
+                    yield f'data: {json.dumps({"type": "export", "url": url, "formato": pedido["formato"], "agrupar": pedido["agrupar"]}, ensure_ascii=False)}\n\n'
+                    result = {"status": "ok", "url": url, "expira_em_min": EXPORT_TTL // 60, "avisos": result["avisos"]}
                 elif tu.name in RENDER_TOOLS:
                     widget_type = result.get("widget", "unknown")
                     yield f'data: {json.dumps({"type": widget_type, "data": result}, ensure_ascii=False)}\n\n'
@@ -309,11 +428,10 @@ async def process_message(user_id: int, conversa_id: int, user_message: str):
                 final_text += block.text
         if final_text:
             now = datetime.utcnow().isoformat()
-            conn.execute(
+            await writer.execute(
                 "INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
                 (conversa_id, "assistant", final_text, now),
             )
-            conn.commit()
 
     conn.close()
     yield f'data: {json.dumps({"type": "done"})}\n\n'
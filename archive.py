@@ -0,0 +1,166 @@
+"""
+Arquivo frio: move conversas inativas para `mensagens_arquivo` e comprime o HTML
+de dashboards antigos. A leitura descomprime de forma transparente.
+
+    python archive.py --dias 90
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from db import DB_PATH, get_db, init_db, try_file_lock
+
+ARCHIVE_DAYS = int(os.environ.get("QHUB_ARCHIVE_DAYS", "90"))  # 0 desliga o job
+ARCHIVE_INTERVAL = 3600  # Segundos entre execuções do job
+ZLIB_LEVEL = 6
+
+
+def comprimir(texto: str) -> bytes:
+    return zlib.compress(texto.encode(), ZLIB_LEVEL)
+
+
+def descomprimir(blob: bytes) -> str:
+    return zlib.decompress(blob).decode()
+
+
+# --- Leitura transparente ---
+
+
+def mensagens_arquivadas(conn, conversa_id: int) -> list[dict]:
+    row = conn.execute(
+        "SELECT payload FROM mensagens_arquivo WHERE conversa_id = ?", (conversa_id,)
+    ).fetchone()
+    return json.loads(descomprimir(row["payload"])) if row else []
+
+
+def mensagens_da_conversa(conn, conversa_id: int) -> list[dict]:
+    """Todas as mensagens (arquivadas + ativas) por ordem cronológica."""
+    msgs = mensagens_arquivadas(conn, conversa_id)
+    msgs += [
+        dict(m)
+        for m in conn.execute(
+            "SELECT id, role, content, timestamp FROM mensagens WHERE conversa_id = ? ORDER BY timestamp",
+            (conversa_id,),
+        )
+    ]
+    return msgs
+
+
+def html_dashboard(dash) -> str:
+    return descomprimir(dash["html_z"]) if dash["html_z"] is not None else dash["html"]
+
+
+def restaurar_conversa(conn, conversa_id: int):
+    """Devolve uma conversa arquivada à tabela quente (quando o user volta a escrever nela)."""
+    msgs = mensagens_arquivadas(conn, conversa_id)
+    if not msgs:
+        return
+    conn.executemany(
+        "INSERT OR IGNORE INTO mensagens (id, conversa_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+        [(m["id"], conversa_id, m["role"], m["content"], m["timestamp"]) for m in msgs],
+    )
+    conn.execute("DELETE FROM mensagens_arquivo WHERE conversa_id = ?", (conversa_id,))
+    conn.commit()
+
+
+# --- Arquivo ---
+
+
+def arquivar_conversas(dias: int) -> int:
+    """Arquiva conversas sem mensagens nos últimos `dias`. Uma transação por conversa."""
+    limite = (datetime.utcnow() - timedelta(days=dias)).isoformat()
+    inativa = """
+        SELECT c.id FROM conversas c
+        WHERE c.created_at < ?
+          AND EXISTS (SELECT 1 FROM mensagens m WHERE m.conversa_id = c.id)
+          AND NOT EXISTS (SELECT 1 FROM mensagens m WHERE m.conversa_id = c.id AND m.timestamp >= ?)
+    """
+    conn = get_db()
+    ids = [r["id"] for r in conn.execute(inativa, (limite, limite)).fetchall()]
+    arquivadas = 0
+    for conversa_id in ids:
+        # O user pode ter escrito entretanto: a inatividade volta a ser verificada já
+        # com o lock de escrita, e só se apagam as mensagens que foram para o payload
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute(inativa + " AND c.id = ?", (limite, limite, conversa_id)).fetchone():
+                conn.rollback()
+                continue
+            msgs = mensagens_da_conversa(conn, conversa_id)
+            conn.execute(
+                "INSERT OR REPLACE INTO mensagens_arquivo (conversa_id, n_mensagens, payload, archived_at) VALUES (?, ?, ?, ?)",
+                (conversa_id, len(msgs), comprimir(json.dumps(msgs, ensure_ascii=False)), datetime.utcnow().isoformat()),
+            )
+            conn.execute(
+                "DELETE FROM mensagens WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps([m["id"] for m in msgs]),),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        arquivadas += 1
+    conn.close()
+    return arquivadas
+
+
+def arquivar_dashboards(dias: int, lote: int = 100) -> int:
+    """Comprime o HTML de dashboards criados há mais de `dias`."""
+    limite = (datetime.utcnow() - timedelta(days=dias)).isoformat()
+    conn = get_db()
+    total = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, html FROM dashboards WHERE html_z IS NULL AND created_at < ? LIMIT ?",
+            (limite, lote),
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE dashboards SET html_z = ?, html = '' WHERE id = ?",
+            [(comprimir(r["html"]), r["id"]) for r in rows],
+        )
+        conn.commit()
+        total += len(rows)
+    conn.close()
+    return total
+
+
+def arquivar(dias: int = ARCHIVE_DAYS) -> dict:
+    return {"conversas": arquivar_conversas(dias), "dashboards": arquivar_dashboards(dias)}
+
+
+def iniciar_job(dias: int = ARCHIVE_DAYS, intervalo: int = ARCHIVE_INTERVAL):
+    """
+    Corre o arquivo periodicamente numa thread daemon. Com vários workers só o que
+    tem o lock arquiva; se esse processo morrer, outro fica com o lock na volta seguinte.
+    """
+    if dias <= 0:
+        return
+
+    def _loop():
+        lider = None
+        while True:
+            if lider is None:
+                lider = try_file_lock(DB_PATH + ".archive.lock")
+            if lider is not None:
+                try:
+                    arquivar(dias)
+                except Exception as e:
+                    print(f"archive: erro ao arquivar: {e}")
+            time.sleep(intervalo)
+
+    threading.Thread(target=_loop, name="qhub-archive", daemon=True).start()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Arquiva conversas e dashboards inativos.")
+    ap.add_argument("--dias", type=int, default=ARCHIVE_DAYS)
+    args = ap.parse_args()
+    init_db()
+    print(arquivar(args.dias))
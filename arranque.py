@@ -0,0 +1,95 @@
+"""
+Fases do arranque de um worker: quanto demora cada uma e se o worker já está
+pronto (GET /ready). Fases lentas e não essenciais correm em background.
+
+    QHUB_STARTUP_TRACE=1 uvicorn server:app   # imprime cada fase no stderr
+
+Para o detalhe dos imports: `python -X importtime -c "import server"`
+(ou benchmarks/bench_startup.py, que resume essa saída).
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+
+TRACE = os.environ.get("QHUB_STARTUP_TRACE", "") not in ("", "0")
+
+_t0 = time.perf_counter()  # Importado primeiro pelo server.py: conta os imports da app
+_fases: dict[str, dict] = {}  # nome → {inicio_ms, ms, background}
+_pendentes: set[str] = set()  # Fases em background de que o /ready depende
+_startup_feito = False
+_lock = threading.Lock()
+
+
+def _ms(t: float) -> float:
+    return round((t - _t0) * 1000, 1)
+
+
+def _registar(nome: str, inicio: float, background: bool):
+    fim = time.perf_counter()
+    with _lock:
+        _fases[nome] = {"inicio_ms": _ms(inicio), "ms": round((fim - inicio) * 1000, 1), "background": background}
+    if TRACE:
+        print(f"arranque: {nome:<16s} {(fim - inicio) * 1000:8.1f} ms  (t={_ms(fim):.1f} ms)", file=sys.stderr)
+
+
+def marco(nome: str):
+    """Regista uma fase que começou com o processo (ex: imports)."""
+    _registar(nome, _t0, False)
+
+
+@contextlib.contextmanager
+def fase(nome: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registar(nome, inicio, False)
+
+
+def em_background(nome: str, fn, bloqueia_ready: bool = True):
+    """Corre fn numa thread daemon. Com bloqueia_ready o /ready espera por ela."""
+    if bloqueia_ready:
+        with _lock:
+            _pendentes.add(nome)
+
+    def _correr():
+        inicio = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            print(f"arranque: {nome} falhou: {e}", file=sys.stderr)
+        finally:
+            _registar(nome, inicio, True)
+            with _lock:
+                _pendentes.discard(nome)
+            _talvez_pronto()
+
+    threading.Thread(target=_correr, name=f"qhub-arranque-{nome}", daemon=True).start()
+
+
+def startup_concluido():
+    """Chamado no fim do evento startup (as fases síncronas terminaram)."""
+    global _startup_feito
+    _startup_feito = True
+    _talvez_pronto()
+
+
+def _talvez_pronto():
+    with _lock:
+        if not _startup_feito or _pendentes or "pronto" in _fases:
+            return
+        _fases["pronto"] = {"inicio_ms": _ms(time.perf_counter()), "ms": 0.0, "background": False}
+    if TRACE:
+        print(f"arranque: pronto em {_fases['pronto']['inicio_ms']:.1f} ms", file=sys.stderr)
+
+
+def pronto() -> bool:
+    return "pronto" in _fases
+
+
+def relatorio() -> dict:
+    with _lock:
+        return {"pronto": "pronto" in _fases, "pendentes": sorted(_pendentes), "fases": dict(_fases)}
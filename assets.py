@@ -0,0 +1,97 @@
+"""
+Ficheiros estáticos servidos pela app: URLs com hash do conteúdo, variantes gzip
+pré-calculadas e cache longa. Substitui o mount StaticFiles.
+
+`static/index.html` referencia `/assets/<caminho>`; ao carregar, essas referências
+passam a `/assets/<nome>.<hash>.<ext>`, que pode ficar em cache para sempre.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+HASH_LEN = 12
+GZIP_LEVEL = 9
+COMPRIMIR = {"text/html", "text/css", "text/javascript", "application/javascript", "application/json", "text/plain"}
+
+_FINGERPRINT = re.compile(rf"^(?P<base>.+)\.(?P<hash>[0-9a-f]{{{HASH_LEN}}})(?P<ext>\.[^./]+)$")
+_REF = re.compile(r"/assets/([\w./-]+)")
+
+
+class Asset:
+    def __init__(self, caminho: str, conteudo: bytes):
+        self.caminho = caminho
+        self.media_type = mimetypes.guess_type(caminho)[0] or "application/octet-stream"
+        if self.media_type.startswith("text/"):
+            self.media_type += "; charset=utf-8"
+        self.conteudo = conteudo
+        self.etag = hashlib.sha256(conteudo).hexdigest()[:HASH_LEN]
+        base, ext = os.path.splitext(caminho)
+        self.url = f"/assets/{base}.{self.etag}{ext}"
+        comprimivel = self.media_type.split(";")[0] in COMPRIMIR
+        self.gz = gzip.compress(conteudo, GZIP_LEVEL, mtime=0) if comprimivel else None
+
+
+_assets: dict[str, Asset] = {}
+_index: Asset | None = None
+_lock = threading.Lock()
+
+
+def carregar():
+    """Lê static/, calcula hashes e gzip, e reescreve as referências do index.html."""
+    global _index
+    novos = {}
+    for raiz, _, ficheiros in os.walk(STATIC_DIR):
+        for nome in ficheiros:
+            completo = os.path.join(raiz, nome)
+            caminho = os.path.relpath(completo, STATIC_DIR).replace(os.sep, "/")
+            with open(completo, "rb") as f:
+                novos[caminho] = Asset(caminho, f.read())
+
+    index = novos.pop("index.html")
+    html = _REF.sub(
+        lambda m: novos[m.group(1)].url if m.group(1) in novos else m.group(0),
+        index.conteudo.decode(),
+    )
+    with _lock:
+        _assets.clear()
+        _assets.update(novos)
+        _index = Asset("index.html", html.encode())
+
+
+def _garantir():
+    if _index is None:
+        carregar()
+
+
+def url(caminho: str) -> str:
+    """URL com fingerprint de um ficheiro em static/ (ex: 'vendor/chart.umd.min.js')."""
+    _garantir()
+    return _assets[caminho].url
+
+
+def index() -> Asset:
+    _garantir()
+    return _index
+
+
+def resolver(pedido: str) -> tuple[Asset | None, bool]:
+    """
+    Devolve (asset, imutavel). `imutavel` só é True quando o hash pedido é o atual;
+    um hash antigo (ex: dashboard pré-renderizado antes de um upgrade) recebe o
+    conteúdo atual, mas sem cache longa.
+    """
+    _garantir()
+    if pedido in _assets:
+        return _assets[pedido], False
+    m = _FINGERPRINT.match(pedido)
+    if not m:
+        return None, False
+    asset = _assets.get(m.group("base") + m.group("ext"))
+    if not asset:
+        return None, False
+    return asset, asset.etag == m.group("hash")
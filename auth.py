@@ -2,7 +2,14 @@
 Autenticação simples com JWT.
 """
 
+import asyncio
+import multiprocessing
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
@@ -10,17 +17,79 @@ from db import get_db
 
 SECRET_KEY = os.environ.get("JWT_SECRET", "qhub-poc-secret-mude-em-producao")
 
+HASH_WORKERS = int(os.environ.get("QHUB_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+LOGIN_CONCURRENCY = int(os.environ.get("QHUB_LOGIN_CONCURRENCY", str(HASH_WORKERS * 2)))  # Os restantes esperam
+TOKEN_CACHE_SIZE = 1024
+
+
+# --- bcrypt fora do event loop ---
+# Cada checkpw/hashpw são ~250 ms de CPU: correm num pool de processos para não
+# congelar os chats (e sem disputar o GIL com o servidor).
+
+_executor = None
+_executor_lock = threading.Lock()
+_login_slots = None
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: o processo pai tem threads (writer, jobs), fork não é seguro
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _noop():
+    return None
+
+
+def iniciar_pool():
+    """Arranca os processos do pool em background (o spawn custa ~1 s por processo)."""
+    pool = _pool()
+    for _ in range(HASH_WORKERS):
+        pool.submit(_noop)
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+
+def _check(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode(), password_hash.encode())
+
+
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_pool(), _hash, password)
+
 
-def authenticate(email: str, password: str) -> dict | None:
+async def check_password(password: str, password_hash: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_pool(), _check, password, password_hash)
+
+
+async def authenticate(email: str, password: str) -> dict | None:
     """Valida credenciais e devolve token + info do user."""
+    global _login_slots
     conn = get_db()
     user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
     conn.close()
 
     if not user:
         return None
-    if not bcrypt.checkpw(password.encode(), user["password_hash"].encode()):
-        return None
+    if _login_slots is None:
+        _login_slots = asyncio.Semaphore(LOGIN_CONCURRENCY)
+    # Limite de logins em simultâneo: numa troca de turno os restantes ficam em fila
+    async with _login_slots:
+        if not await check_password(password, user["password_hash"]):
+            return None
 
     token = jwt.encode(
         {
@@ -35,9 +104,52 @@ def authenticate(email: str, password: str) -> dict | None:
     return {"token": token, "nome": user["nome"], "role": user["role"]}
 
 
+# --- Cache de tokens verificados ---
+
+_tokens = OrderedDict()  # token → payload
+_tokens_lock = threading.Lock()
+
+
 def verify_token(token: str) -> dict | None:
     """Verifica e descodifica um JWT. Devolve payload ou None."""
+    with _tokens_lock:
+        payload = _tokens.get(token)
+        if payload is not None:
+            if payload.get("exp", float("inf")) > time.time():
+                _tokens.move_to_end(token)
+                return payload
+            del _tokens[token]
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+    with _tokens_lock:
+        _tokens[token] = payload
+        while len(_tokens) > TOKEN_CACHE_SIZE:
+            _tokens.popitem(last=False)
+    return payload
+
+
+# --- Links de exportação ---
+# A tool exportar_defeitos devolve ao modelo um link em vez dos dados. O token
+# leva o pedido assinado e expira depressa; usa outra chave para não servir de
+# token de sessão (nem um token de sessão servir de link).
+
+EXPORT_TTL = int(os.environ.get("QHUB_EXPORT_TTL", "900"))  # Segundos
+_EXPORT_KEY = SECRET_KEY + ":export"
+
+
+def assinar_exportacao(user_id: int, pedido: dict) -> str:
+    return jwt.encode(
+        {"user_id": user_id, "pedido": pedido, "exp": datetime.utcnow() + timedelta(seconds=EXPORT_TTL)},
+        _EXPORT_KEY,
+        algorithm="HS256",
+    )
+
+
+def verificar_exportacao(token: str) -> dict | None:
+    """Payload de um link de exportação ({user_id, pedido, exp}) ou None."""
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        return jwt.decode(token, _EXPORT_KEY, algorithms=["HS256"])
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return None
@@ -0,0 +1,126 @@
+"""
+Benchmark de leituras e escritas concorrentes em `mensagens`.
+
+Simula N writers SSE (cada um grava mensagens e relê o histórico, como o
+process_message) contra uma base de dados temporária, comparando o acesso
+antigo (sqlite3.connect por pedido, rollback journal) com o pool afinado do db.py.
+
+    python benchmarks/bench_db.py --writers 64 --mensagens 50
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+_tmp = tempfile.mkdtemp(prefix="qhub-bench-")
+os.environ["QHUB_DB_PATH"] = os.path.join(_tmp, "bench.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import db  # noqa: E402
+
+
+def _legacy_db():
+    conn = sqlite3.connect(db.DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def _writer(get_conn, conversa_id, n, latencias):
+    for i in range(n):
+        t0 = time.perf_counter()
+        conn = get_conn()
+        conn.execute(
+            "INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            (conversa_id, "user", f"mensagem {i} " * 20, datetime.utcnow().isoformat()),
+        )
+        conn.commit()
+        conn.execute(
+            "SELECT role, content FROM mensagens WHERE conversa_id = ? ORDER BY timestamp DESC LIMIT 20",
+            (conversa_id,),
+        ).fetchall()
+        conn.close()
+        latencias.append(time.perf_counter() - t0)
+
+
+def _reader(get_conn, conversa_id, parar, latencias):
+    while not parar.is_set():
+        t0 = time.perf_counter()
+        conn = get_conn()
+        conn.execute(
+            "SELECT role, content, timestamp FROM mensagens WHERE conversa_id = ? ORDER BY timestamp",
+            (conversa_id,),
+        ).fetchall()
+        conn.close()
+        latencias.append(time.perf_counter() - t0)
+
+
+def _p(latencias, q):
+    s = sorted(latencias)
+    return s[min(len(s) - 1, int(len(s) * q))] * 1000
+
+
+def correr(nome, get_conn, writers, mensagens, readers):
+    conn = get_conn()
+    conversas = [
+        conn.execute(
+            "INSERT INTO conversas (user_id, agente_id, created_at) VALUES (1, 1, ?)",
+            (datetime.utcnow().isoformat(),),
+        ).lastrowid
+        for _ in range(writers)
+    ]
+    conn.commit()
+    conn.close()
+
+    lat_w, lat_r, parar = [], [], threading.Event()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers + readers) as ex:
+        rs = [ex.submit(_reader, get_conn, conversas[i % writers], parar, lat_r) for i in range(readers)]
+        ws = [ex.submit(_writer, get_conn, c, mensagens, lat_w) for c in conversas]
+        for f in ws:
+            f.result()
+        parar.set()
+        for f in rs:
+            f.result()
+    total = time.perf_counter() - t0
+
+    escritas = writers * mensagens
+    print(
+        f"{nome:8s} {escritas / total:9.0f} escritas/s  {len(lat_r) / total:9.0f} leituras/s  "
+        f"escrita p50={_p(lat_w, 0.5):6.2f}ms p99={_p(lat_w, 0.99):7.2f}ms  "
+        f"leitura p50={_p(lat_r, 0.5):6.2f}ms p99={_p(lat_r, 0.99):7.2f}ms"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--writers", type=int, default=32)
+    ap.add_argument("--mensagens", type=int, default=50)
+    ap.add_argument("--readers", type=int, default=8)
+    args = ap.parse_args()
+
+    db.init_db()
+    db.close_pool()
+    print(f"{args.writers} writers x {args.mensagens} mensagens, {args.readers} readers — {db.DB_PATH}")
+
+    # Modo antigo: rollback journal + ligação nova por operação
+    conn = _legacy_db()
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+    correr("legacy", _legacy_db, args.writers, args.mensagens, args.readers)
+
+    conn = db.connect()
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    correr("pool", db.get_db, args.writers, args.mensagens, args.readers)
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark da pesquisa de texto (FTS5) sobre um histórico grande.
+
+Cria uma base de dados temporária com N mensagens sintéticas repartidas por
+vários users (inseridas pelos triggers da migração 8, como em produção) e mede
+a latência de pesquisas típicas de um user: termo raro, termo comum, vários
+termos, prefixo e dashboards.
+
+    python benchmarks/bench_search.py --mensagens 2000000 --users 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+DEFEITOS = ["lixo", "casca de laranja", "falta de tinta", "crateras", "escorridos", "bolhas", "riscos", "fervura"]
+MATERIAIS = ["PP Negro", "ABS Cinza", "PA Branco", "PP Vermelho"]
+TURNOS = ["manhã", "tarde", "noite"]
+FRASES = [
+    "Quantos defeitos de {d} tivemos no turno da {t}?",
+    "Os defeitos de {d} no rack R{r} aumentaram esta semana no {m}.",
+    "Mostra o Pareto dos defeitos do turno da {t} para o {m}.",
+    "A {d} concentra-se nas posições altas do rack R{r}, sobretudo à {t}.",
+    "Compara {d} e {d2} entre o turno da {t} e os restantes.",
+    "Gera um dashboard com a evolução de {d} no rack R{r}.",
+]
+PESQUISAS = {
+    "termo raro": "fervura",
+    "termo comum": "defeitos",
+    "dois termos": "crateras R11",
+    "frase longa": "quando falámos de crateras no rack R11",
+    "prefixo": "escor*",
+}
+
+
+def _texto(rng: random.Random, frases: int = 1) -> str:
+    return " ".join(
+        rng.choice(FRASES).format(
+            d=rng.choice(DEFEITOS), d2=rng.choice(DEFEITOS), t=rng.choice(TURNOS),
+            m=rng.choice(MATERIAIS), r=rng.randint(10, 15),
+        )
+        for _ in range(frases)
+    )
+
+
+def preparar(mensagens: int, users: int, por_conversa: int, lote: int = 50000):
+    """Cria users, conversas, dashboards e mensagens; devolve os segundos de inserção."""
+    import db
+
+    db.init_db()
+    conn = db.get_db()
+    conn.executemany(
+        "INSERT INTO users (nome, email, password_hash, role) VALUES (?, ?, '', 'responsavel')",
+        [(f"Bench {u}", f"bench{u}@demo.com") for u in range(users)],
+    )
+    user_ids = [r[0] for r in conn.execute("SELECT id FROM users")]
+    rng = random.Random(42)
+    inicio = datetime(2025, 1, 1)
+    n_conversas = max(1, mensagens // por_conversa)
+    conn.executemany(
+        "INSERT INTO conversas (user_id, agente_id, created_at) VALUES (?, 1, ?)",
+        [(user_ids[i % len(user_ids)], (inicio + timedelta(minutes=i)).isoformat()) for i in range(n_conversas)],
+    )
+    conn.executemany(
+        "INSERT INTO dashboards (id, user_id, titulo, html, created_at) VALUES (?, ?, ?, '', ?)",
+        [
+            (f"bench{i:07d}", user_ids[i % len(user_ids)], f"Defeitos de {rng.choice(DEFEITOS)} no rack R{rng.randint(10, 15)}", inicio.isoformat())
+            for i in range(n_conversas // 10)
+        ],
+    )
+    conn.commit()
+    primeira = conn.execute("SELECT MIN(id) FROM conversas").fetchone()[0]
+
+    t0 = time.perf_counter()
+    feitas = 0
+    while feitas < mensagens:
+        n = min(lote, mensagens - feitas)
+        conn.executemany(
+            "INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            [
+                (primeira + (feitas + i) // por_conversa, "user" if i % 2 == 0 else "assistant",
+                 _texto(rng, 1 if i % 2 == 0 else rng.randint(2, 6)),  # Respostas mais longas
+                 (inicio + timedelta(seconds=feitas + i)).isoformat())
+                for i in range(n)
+            ],
+        )
+        conn.commit()
+        feitas += n
+    segundos = time.perf_counter() - t0
+    conn.close()
+    return segundos, user_ids
+
+
+def _p(tempos, q):
+    s = sorted(tempos)
+    return s[min(len(s) - 1, int(len(s) * q))] * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--mensagens", type=int, default=2_000_000)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--por-conversa", type=int, default=40, help="Mensagens por conversa")
+    ap.add_argument("--repeticoes", type=int, default=50)
+    ap.add_argument("--limit", type=int, default=20)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="qhub-bench-")
+    os.environ["QHUB_DB_PATH"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, RAIZ)
+    import db
+    import pesquisa
+
+    segundos, user_ids = preparar(args.mensagens, args.users, args.por_conversa)
+    tamanho = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+    print(
+        f"{args.mensagens} mensagens, {args.users} users: inseridas em {segundos:.1f}s "
+        f"({args.mensagens / segundos:,.0f}/s com índice FTS), DB {tamanho / 1e6:.0f} MB"
+    )
+
+    conn = db.get_db()
+    user_id = user_ids[0]
+    casos = [(nome, "mensagens_fts", "content", pesquisa.pesquisar_mensagens, q) for nome, q in PESQUISAS.items()]
+    casos.append(("dashboards", "dashboards_fts", "titulo", pesquisa.pesquisar_dashboards, "crateras R11"))
+    for nome, tabela, coluna, fn, q in casos:
+        fn(conn, user_id, q, args.limit)  # Aquece a page cache
+        tempos = []
+        for _ in range(args.repeticoes):
+            t0 = time.perf_counter()
+            resultados = fn(conn, user_id, q, args.limit)
+            tempos.append(time.perf_counter() - t0)
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM {tabela} WHERE {tabela} MATCH ?",
+            (f'chaves : "u{user_id}" AND {pesquisa.consulta_fts(q, coluna)}',),
+        ).fetchone()[0]
+        print(
+            f"{nome:12s} {q!r:42s} {total:>9d} resultados  "
+            f"p50={_p(tempos, 0.5):7.2f}ms  p99={_p(tempos, 0.99):7.2f}ms  ({len(resultados['resultados'])} devolvidos)"
+        )
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
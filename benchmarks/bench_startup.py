@@ -0,0 +1,133 @@
+"""
+Benchmark do arranque a frio: tempo até o worker responder 200 em /ready.
+
+Cada execução arranca `uvicorn server:app` num processo novo e mede, de fora, o
+tempo desde o Popen até ao primeiro 200. Dois cenários: base de dados nova
+(init + migrações + seed) e base de dados já existente. No fim resume
+`python -X importtime -c "import server"` (imports mais caros).
+
+    python benchmarks/bench_startup.py --execucoes 5 --alvo 1.5
+
+Termina com código 1 se a mediana de algum cenário passar o alvo (segundos).
+"""
+
+import argparse
+import http.client
+import json
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar(db_path: str, caminho: str, timeout: float = 60) -> tuple[float, dict | None]:
+    """Arranca um servidor e devolve (segundos até 200 em `caminho`, corpo JSON)."""
+    porta = _porta_livre()
+    env = dict(os.environ, QHUB_DB_PATH=db_path, QHUB_ARCHIVE_DAYS="0")
+    t0 = time.perf_counter()
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(porta), "--log-level", "warning"],
+        cwd=RAIZ, env=env, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                c = http.client.HTTPConnection("127.0.0.1", porta, timeout=1)
+                c.request("GET", caminho)
+                r = c.getresponse()
+                corpo = r.read()
+                if r.status == 200:
+                    segundos = time.perf_counter() - t0
+                    try:
+                        return segundos, json.loads(corpo)
+                    except ValueError:
+                        return segundos, None
+            except OSError:
+                pass
+            time.sleep(0.005)
+        raise RuntimeError("servidor não ficou pronto")
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+
+def cenario(nome: str, execucoes: int, caminho: str, db_nova: bool) -> float:
+    tmp = tempfile.mkdtemp(prefix="qhub-bench-")
+    db_path = os.path.join(tmp, "bench.db")
+    if not db_nova:
+        arrancar(db_path, caminho)  # Cria a DB; as execuções seguintes encontram-na feita
+    tempos, relatorio = [], None
+    for i in range(execucoes):
+        if db_nova:
+            db_path = os.path.join(tmp, f"bench-{i}.db")
+        segundos, relatorio = arrancar(db_path, caminho)
+        tempos.append(segundos)
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    mediana = statistics.median(tempos)
+    print(f"{nome:14s} pronto em mediana={mediana * 1000:7.0f}ms  min={min(tempos) * 1000:7.0f}ms  max={max(tempos) * 1000:7.0f}ms")
+    if relatorio and "fases" in relatorio:
+        fases = "  ".join(
+            f"{n}={f['ms']:.0f}ms{'*' if f['background'] else ''}"
+            for n, f in relatorio["fases"].items() if n != "pronto"
+        )
+        print(f"{'':14s} fases (última execução, * = background): {fases}")
+    return mediana
+
+
+def importtime(top: int):
+    """Resume -X importtime: total do server e os imports diretos mais caros."""
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=RAIZ, capture_output=True, text=True,
+    )
+    diretos = []
+    for linha in r.stderr.splitlines():
+        m = _IMPORTTIME.match(linha)
+        if not m:
+            continue
+        cumulativo, nivel, nome = int(m.group(2)), len(m.group(3)) // 2, m.group(4)
+        if nome == "server":
+            print(f"\nimport server: {cumulativo / 1000:.0f}ms (python -X importtime)")
+        elif nivel == 1:
+            diretos.append((cumulativo, nome))
+    for cumulativo, nome in sorted(diretos, reverse=True)[:top]:
+        print(f"  {cumulativo / 1000:7.1f}ms  {nome}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--execucoes", type=int, default=5)
+    ap.add_argument("--alvo", type=float, default=1.5, help="Mediana máxima aceitável (segundos)")
+    ap.add_argument("--caminho", default="/ready", help="Endpoint que indica prontidão")
+    ap.add_argument("--top", type=int, default=8, help="Imports a mostrar")
+    args = ap.parse_args()
+
+    medianas = [
+        cenario("db nova", args.execucoes, args.caminho, db_nova=True),
+        cenario("db existente", args.execucoes, args.caminho, db_nova=False),
+    ]
+    importtime(args.top)
+
+    if max(medianas) > args.alvo:
+        print(f"\nFALHA: mediana acima do alvo de {args.alvo * 1000:.0f}ms")
+        sys.exit(1)
+    print(f"\nOK: medianas dentro do alvo de {args.alvo * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Benchmark das tools de análise (contar_defeitos, top_defeitos, defeitos_por_turno)
+sobre dados sintéticos de 1e3 a 1e7 linhas.
+
+Para cada tamanho e caminho de dados mede, num processo próprio (pico de RSS
+limpo): tempo de carga, RSS máximo e latência de cada tool.
+
+  csv       leitura do CSV por chamada, como as tools originais (list de dicts)
+  build     construção do snapshot a partir do CSV (store.construir)
+  snapshot  abertura do snapshot já construído (mmap) + tools atuais
+
+Só build e snapshot entram na comparação entre versões; csv é a referência.
+
+Os CSVs sintéticos ficam em cache em --dados (gerados com semente fixa) e têm
+cardinalidades realistas: 3 turnos, 40 operadores, 12 tipos de defeito com
+distribuição de Pareto, 16 materiais, 60 racks, 365 dias.
+
+    python benchmarks/bench_tools.py --tamanhos 1e3,1e4,1e5,1e6,1e7 --saida bench_tools.json
+    python benchmarks/bench_tools.py --comparar bench_tools.json   # falha se houver regressões
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CAMINHOS = ("csv", "build", "snapshot")
+
+# Chamadas medidas: (nome no relatório, tool, argumentos)
+CHAMADAS = [
+    ("contar_defeitos", "contar_defeitos", {}),
+    ("contar_defeitos(tipo)", "contar_defeitos", {"tipo_defeito": "lixo"}),
+    ("top_defeitos", "top_defeitos", {"n": 5}),
+    ("defeitos_por_turno", "defeitos_por_turno", {}),
+    ("defeitos_por_turno(turno)", "defeitos_por_turno", {"turno": "noite"}),
+]
+
+# --- Dados sintéticos ---
+
+TURNOS = (["manha", "tarde", "noite"], [0.40, 0.35, 0.25])
+TIPOS = [
+    "lixo", "casca_laranja", "falta_tinta", "crateras", "descasque", "gordura",
+    "escorrido", "fervura", "risco", "bolha", "mancha", "poeira",
+]
+MATERIAIS = [f"{m}_{c}" for m in ("PP", "ABS", "PA", "PC") for c in ("Negro", "Cinza", "Branco", "Vermelho")]
+OPERADORES = [f"Operador{i:02d}" for i in range(1, 41)]
+RACKS = [f"R{i:02d}" for i in range(1, 61)]
+DIAS = [(date(2025, 1, 1) + timedelta(days=i)).isoformat() for i in range(365)]
+LOTE = 100_000
+
+
+def gerar(caminho: str, linhas: int, semente: int = 42):
+    """CSV sintético com as colunas do defeitos.csv (escrito em lotes)."""
+    rng = random.Random(semente)
+    pesos_tipo = [1 / (i + 1) for i in range(len(TIPOS))]  # Pareto: poucos tipos dominam
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "data", "turno", "operador", "tipo_defeito", "material", "rack", "posicao"])
+        for inicio in range(0, linhas, LOTE):
+            k = min(LOTE, linhas - inicio)
+            w.writerows(zip(
+                range(inicio + 1, inicio + k + 1),
+                rng.choices(DIAS, k=k),
+                rng.choices(TURNOS[0], TURNOS[1], k=k),
+                rng.choices(OPERADORES, k=k),
+                rng.choices(TIPOS, pesos_tipo, k=k),
+                rng.choices(MATERIAIS, k=k),
+                rng.choices(RACKS, k=k),
+                rng.choices(range(1, 13), k=k),
+            ))
+    os.replace(tmp, caminho)
+
+
+# --- Caminho "csv": as tools originais, que liam o CSV inteiro a cada chamada ---
+
+
+def _legacy_tools(data_path: str) -> dict:
+    def ler():
+        with open(data_path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+    def contar_defeitos(tipo_defeito=None):
+        rows = ler()
+        if tipo_defeito:
+            return {"tipo_defeito": tipo_defeito, "total": sum(1 for r in rows if r["tipo_defeito"] == tipo_defeito)}
+        return {"total": len(rows), "por_tipo": dict(Counter(r["tipo_defeito"] for r in rows).most_common())}
+
+    def top_defeitos(n=5):
+        rows = ler()
+        top = Counter(r["tipo_defeito"] for r in rows).most_common(n)
+        return {"total_registos": len(rows), "top": [{"tipo": t, "total": c} for t, c in top]}
+
+    def defeitos_por_turno(turno=None):
+        rows = ler()
+        if turno:
+            rows = [r for r in rows if r["turno"] == turno]
+        result = {}
+        for r in rows:
+            result.setdefault(r["turno"], Counter())[r["tipo_defeito"]] += 1
+        return {"por_turno": {k: {"total": sum(v.values()), "defeitos": dict(v.most_common())} for k, v in result.items()}}
+
+    return {"contar_defeitos": contar_defeitos, "top_defeitos": top_defeitos, "defeitos_por_turno": defeitos_por_turno, "ler": ler}
+
+
+# --- Medição (processo filho) ---
+
+
+def _rss_mb() -> float:
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / 1024 / 1024
+
+
+def _latencias(fn, kwargs, repeticoes: int) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn(**kwargs)
+        tempos.append(time.perf_counter() - t0)
+    tempos.sort()
+    return {
+        "p50_us": round(statistics.median(tempos) * 1e6, 1),
+        "p99_us": round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))] * 1e6, 1),
+    }
+
+
+def medir(caminho: str, data_path: str, repeticoes: int) -> dict:
+    """Corre no processo filho: carga, pico de RSS e latência das tools."""
+    snapshot = data_path + ".snap"
+    os.environ["QHUB_DATA_PATH"] = data_path
+    os.environ["QHUB_SNAPSHOT_PATH"] = snapshot
+    sys.path.insert(0, RAIZ)
+    import store
+    import tools
+
+    rss_base = _rss_mb()
+    resultado = {"tools": {}}
+    if caminho == "csv":
+        legacy = _legacy_tools(data_path)
+        t0 = time.perf_counter()
+        legacy["ler"]()
+        resultado["carga_s"] = round(time.perf_counter() - t0, 4)
+        for nome, tool, kwargs in CHAMADAS:
+            resultado["tools"][nome] = _latencias(legacy[tool], kwargs, max(1, min(repeticoes, 3)))
+    elif caminho == "build":
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+        t0 = time.perf_counter()
+        store.construir(data_path, snapshot)
+        resultado["carga_s"] = round(time.perf_counter() - t0, 4)
+    else:
+        if not os.path.exists(snapshot):
+            store.construir(data_path, snapshot)
+            rss_base = _rss_mb()
+        t0 = time.perf_counter()
+        store.obter()
+        resultado["carga_s"] = round(time.perf_counter() - t0, 4)
+        for nome, tool, kwargs in CHAMADAS:
+            resultado["tools"][nome] = _latencias(getattr(tools, tool), kwargs, repeticoes)
+    resultado["rss_mb"] = round(_rss_mb(), 1)
+    resultado["rss_delta_mb"] = round(_rss_mb() - rss_base, 1)
+    return resultado
+
+
+# --- Relatório ---
+
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _chave(r: dict) -> str:
+    return f"{r['linhas']:>9d} {r['caminho']}"
+
+
+def _metricas(r: dict) -> dict:
+    m = {"carga_s": r["carga_s"], "rss_delta_mb": r["rss_delta_mb"]}
+    m.update({f"{t} p50_us": v["p50_us"] for t, v in r["tools"].items()})
+    return m
+
+
+# Diferenças absolutas abaixo disto são ruído, seja qual for a percentagem
+_MINIMOS = {"carga_s": 0.005, "rss_delta_mb": 2.0, "p50_us": 5.0}
+
+
+def comparar(anterior: dict, atual: dict, tolerancia: float) -> int:
+    antes = {_chave(r): _metricas(r) for r in anterior["resultados"]}
+    print(f"\nComparação com {anterior['meta'].get('commit')} ({anterior['meta'].get('data')}), tolerância {tolerancia:.0%}")
+    regressoes = 0
+    for r in atual["resultados"]:
+        chave = _chave(r)
+        # O caminho csv é uma cópia fixa do código antigo: serve de referência, não regride
+        if chave not in antes or r["caminho"] == "csv":
+            continue
+        for metrica, valor in _metricas(r).items():
+            velho = antes[chave].get(metrica)
+            if velho is None:
+                continue
+            minimo = _MINIMOS.get(metrica.split()[-1], 0)
+            pior = valor > velho * (1 + tolerancia) and valor - velho > minimo
+            regressoes += pior
+            if pior or valor < velho * (1 - tolerancia):
+                print(f"  {'REGRESSÃO' if pior else 'melhoria '}  {chave:22s} {metrica:34s} {velho:>12} -> {valor}")
+    print(f"  {regressoes} regressões")
+    return regressoes
+
+
+def _imprimir(r: dict):
+    tools = "  ".join(f"{t}={v['p50_us']:.0f}us" for t, v in r["tools"].items())
+    print(
+        f"{r['linhas']:>9d} {r['caminho']:9s} carga={r['carga_s'] * 1000:10.1f}ms  "
+        f"rss={r['rss_mb']:7.1f}MB (+{r['rss_delta_mb']:.1f})  {tools}",
+        flush=True,
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--tamanhos", default="1e3,1e4,1e5,1e6,1e7", help="Nº de linhas (lista)")
+    ap.add_argument("--caminhos", default=",".join(CAMINHOS))
+    ap.add_argument("--max-csv", type=float, default=1e6, help="Maior tamanho para o caminho csv (list de dicts)")
+    ap.add_argument("--repeticoes", type=int, default=200, help="Chamadas por tool (csv: no máximo 3)")
+    ap.add_argument("--dados", default=os.path.join(tempfile.gettempdir(), "qhub-bench-tools"))
+    ap.add_argument("--saida", help="Grava o relatório JSON neste ficheiro")
+    ap.add_argument("--comparar", help="Relatório anterior: termina com código 1 se houver regressões")
+    ap.add_argument("--tolerancia", type=float, default=0.25)
+    ap.add_argument("--_filho", nargs=2, metavar=("CAMINHO", "CSV"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args._filho:
+        print(json.dumps(medir(args._filho[0], args._filho[1], args.repeticoes)))
+        return
+
+    os.makedirs(args.dados, exist_ok=True)
+    relatorio = {"meta": _meta(), "resultados": []}
+    print(f"Python {relatorio['meta']['python']}, {relatorio['meta']['cpus']} CPUs, commit {relatorio['meta']['commit']}")
+    for linhas in [int(float(t)) for t in args.tamanhos.split(",")]:
+        data_path = os.path.join(args.dados, f"defeitos_{linhas}.csv")
+        if not os.path.exists(data_path):
+            t0 = time.perf_counter()
+            gerar(data_path, linhas)
+            print(f"gerado {data_path} em {time.perf_counter() - t0:.1f}s", flush=True)
+        for caminho in args.caminhos.split(","):
+            if caminho == "csv" and linhas > args.max_csv:
+                continue
+            r = subprocess.run(
+                [sys.executable, __file__, "--_filho", caminho, data_path, "--repeticoes", str(args.repeticoes)],
+                capture_output=True, text=True,
+            )
+            if r.returncode != 0:
+                print(f"{linhas:>9d} {caminho:9s} falhou: {r.stderr.strip().splitlines()[-1:]}")
+                continue
+            resultado = {"linhas": linhas, "caminho": caminho, **json.loads(r.stdout.splitlines()[-1])}
+            relatorio["resultados"].append(resultado)
+            _imprimir(resultado)
+
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"\nrelatório: {args.saida}")
+    if args.comparar:
+        with open(args.comparar) as f:
+            if comparar(json.load(f), relatorio, args.tolerancia):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmark de throughput HTTP em função do nº de workers do uvicorn.
+
+Arranca `uvicorn server:app --workers N` para cada N pedido, sobre uma base de
+dados temporária, e mede pedidos/s com vários processos cliente (keep-alive) a
+alternar entre leituras típicas: /agentes (cache de agentes), /conversas
+(SQLite) e /dashboards/{id}/data (tools sobre o store partilhado).
+
+Os clientes correm na mesma máquina e também gastam CPU: para números limpos,
+usar --url contra um servidor noutra máquina (os dados têm de existir lá).
+
+    python benchmarks/bench_workers.py --workers 1,2,4 --duracao 10
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+WIDGETS = [
+    {"id": "total", "tool": "contar_defeitos", "args": {}},
+    {"id": "top", "tool": "top_defeitos", "args": {"n": 5}},
+    {"id": "turnos", "tool": "defeitos_por_turno", "args": {}},
+]
+
+
+def _preparar(tmp: str, conversas: int) -> str:
+    """Cria a DB (init + seed), conversas para o user Rui e um dashboard vivo."""
+    os.environ["QHUB_DB_PATH"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, RAIZ)
+    import db
+
+    db.init_db()
+    conn = db.get_db()
+    agora = datetime.utcnow().isoformat()
+    conn.executemany(
+        "INSERT INTO conversas (user_id, agente_id, created_at) VALUES (2, 1, ?)",
+        [(agora,)] * conversas,
+    )
+    dashboard_id = uuid.uuid4().hex[:12]
+    conn.execute(
+        "INSERT INTO dashboards (id, user_id, titulo, html, created_at, widgets) VALUES (?, 2, 'Bench', '', ?, ?)",
+        (dashboard_id, agora, json.dumps(WIDGETS)),
+    )
+    conn.commit()
+    conn.close()
+    db.close_pool()
+    return dashboard_id
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar(host: str, porta: int, timeout: float = 60):
+    prazo = time.monotonic() + timeout
+    while time.monotonic() < prazo:
+        try:
+            c = http.client.HTTPConnection(host, porta, timeout=2)
+            c.request("GET", "/")
+            c.getresponse().read()
+            c.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("servidor não arrancou")
+
+
+def _login(host: str, porta: int) -> str:
+    c = http.client.HTTPConnection(host, porta, timeout=30)
+    c.request(
+        "POST", "/auth/login",
+        body=json.dumps({"email": "rui@demo.com", "password": "rui123"}),
+        headers={"Content-Type": "application/json"},
+    )
+    return json.loads(c.getresponse().read())["token"]
+
+
+def _cliente(host, porta, token, caminhos, duracao, fila):
+    c = http.client.HTTPConnection(host, porta, timeout=30)
+    headers = {"Authorization": f"Bearer {token}"}
+    latencias, erros, i = [], 0, 0
+    fim = time.perf_counter() + duracao
+    while True:
+        t0 = time.perf_counter()
+        if t0 >= fim:
+            break
+        try:
+            c.request("GET", caminhos[i % len(caminhos)], headers=headers)
+            r = c.getresponse()
+            r.read()
+            if r.status != 200:
+                erros += 1
+        except (OSError, http.client.HTTPException):
+            erros += 1
+            c.close()
+            c = http.client.HTTPConnection(host, porta, timeout=30)
+        latencias.append(time.perf_counter() - t0)
+        i += 1
+    fila.put((latencias, erros))
+
+
+def _p(latencias, q):
+    s = sorted(latencias)
+    return s[min(len(s) - 1, int(len(s) * q))] * 1000 if s else 0.0
+
+
+def medir(host, porta, token, caminhos, clientes, duracao):
+    ctx = multiprocessing.get_context("spawn")
+    fila = ctx.Queue()
+    procs = [
+        ctx.Process(target=_cliente, args=(host, porta, token, caminhos, duracao, fila))
+        for _ in range(clientes)
+    ]
+    for p in procs:
+        p.start()
+    latencias, erros = [], 0
+    for _ in procs:
+        lat, err = fila.get()
+        latencias += lat
+        erros += err
+    for p in procs:
+        p.join()
+    return len(latencias) / duracao, _p(latencias, 0.5), _p(latencias, 0.99), erros
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--workers", default="1,2,4", help="Lista de nº de workers a testar")
+    ap.add_argument("--clientes", type=int, default=8, help="Processos cliente (uma ligação cada)")
+    ap.add_argument("--duracao", type=float, default=10.0, help="Segundos de carga por configuração")
+    ap.add_argument("--conversas", type=int, default=200)
+    ap.add_argument("--url", help="Servidor já a correr (ignora --workers)")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="qhub-bench-")
+    dashboard_id = None if args.url else _preparar(tmp, args.conversas)
+    caminhos = ["/agentes", "/conversas?limit=50"]
+    if dashboard_id:
+        caminhos.append(f"/dashboards/{dashboard_id}/data")
+
+    print(f"{args.clientes} clientes x {args.duracao:.0f}s, {os.cpu_count()} CPUs — {', '.join(caminhos)}")
+    if args.url:
+        u = urlsplit(args.url)
+        token = _login(u.hostname, u.port or 80)
+        rps, p50, p99, erros = medir(u.hostname, u.port or 80, token, caminhos, args.clientes, args.duracao)
+        print(f"{args.url}: {rps:8.0f} pedidos/s  p50={p50:6.2f}ms p99={p99:7.2f}ms  erros={erros}")
+        return
+
+    env = dict(os.environ, QHUB_HASH_WORKERS="1", QHUB_ARCHIVE_DAYS="0")
+    base = None
+    for n in [int(w) for w in args.workers.split(",")]:
+        porta = _porta_livre()
+        servidor = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--workers", str(n),
+             "--port", str(porta), "--log-level", "warning", "--no-access-log"],
+            cwd=RAIZ, env=env,
+        )
+        try:
+            _esperar("127.0.0.1", porta)
+            token = _login("127.0.0.1", porta)
+            rps, p50, p99, erros = medir("127.0.0.1", porta, token, caminhos, args.clientes, args.duracao)
+        finally:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+        base = base or rps
+        print(
+            f"workers={n:<3d} {rps:8.0f} pedidos/s  x{rps / base:4.2f}  "
+            f"p50={p50:6.2f}ms p99={p99:7.2f}ms  erros={erros}"
+        )
+
+
+if __name__ == "__main__":
+    main()
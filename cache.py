@@ -0,0 +1,123 @@
+"""
+Cache em memória de agentes e permissões user → agente.
+
+Invalidação: write-through local (os endpoints /admin chamam invalidar()) e entre
+processos pelo contador `cache_versao` da DB, incrementado por triggers em
+`agentes` e `user_agentes`. Quem já faz uma query pode trazer a versão nela e
+passá-la em `versao=`, evitando qualquer ida extra à DB.
+
+Com vários workers, `vigia` propaga as mudanças de `cache_versao` a caches que não
+consultam a versão a cada uso (ex: páginas de dashboards).
+"""
+
+import json
+import sqlite3
+import threading
+
+import db
+
+VERSAO_SQL = "SELECT versao FROM cache_versao WHERE chave = 'agentes'"
+POLL_INTERVAL = 0.5  # Segundos entre verificações de PRAGMA data_version
+
+
+class AgentCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versao = None
+        self._agentes = {}  # agente_id → {id, nome, system_prompt, tools}
+        self._perms = {}  # user_id → set(agente_id)
+
+    def invalidar(self):
+        with self._lock:
+            self._versao = None
+
+    def _sincronizar(self, conn, versao=None):
+        if versao is None:
+            versao = conn.execute(VERSAO_SQL).fetchone()[0]
+        if versao == self._versao:
+            return
+        agentes = {
+            a["id"]: {
+                "id": a["id"],
+                "nome": a["nome"],
+                "system_prompt": a["system_prompt"],
+                "tools": tuple(json.loads(a["tools"])),
+            }
+            for a in conn.execute("SELECT id, nome, system_prompt, tools FROM agentes")
+        }
+        perms = {}
+        for r in conn.execute("SELECT user_id, agente_id FROM user_agentes"):
+            perms.setdefault(r["user_id"], set()).add(r["agente_id"])
+        with self._lock:
+            self._agentes, self._perms, self._versao = agentes, perms, versao
+
+    def agente(self, conn, agente_id: int, versao=None) -> dict | None:
+        self._sincronizar(conn, versao)
+        return self._agentes.get(agente_id)
+
+    def tem_acesso(self, conn, user_id: int, agente_id: int, versao=None) -> bool:
+        self._sincronizar(conn, versao)
+        return agente_id in self._perms.get(user_id, ())
+
+    def agentes_do_user(self, conn, user_id: int, versao=None) -> list[dict]:
+        self._sincronizar(conn, versao)
+        return [self._agentes[a] for a in sorted(self._perms.get(user_id, ())) if a in self._agentes]
+
+
+agentes = AgentCache()
+
+
+class Vigia:
+    """
+    Thread que consulta PRAGMA data_version (muda quando outra ligação, deste ou de
+    outro processo, faz commit) e, só nesse caso, relê `cache_versao`. Cada chave
+    cuja versão mudou chama os callbacks registados.
+    """
+
+    def __init__(self):
+        self._callbacks = {}  # chave → [callback]
+        self._parar = threading.Event()
+        self._thread = None
+
+    def registar(self, chave: str, callback):
+        self._callbacks.setdefault(chave, []).append(callback)
+
+    def start(self, intervalo: float = POLL_INTERVAL):
+        if self._thread:
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, args=(intervalo,), name="qhub-vigia", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._parar.set()
+        self._thread.join()
+        self._thread = None
+
+    def _versoes(self, conn) -> dict:
+        return {r["chave"]: r["versao"] for r in conn.execute("SELECT chave, versao FROM cache_versao")}
+
+    def _loop(self, intervalo: float):
+        conn = db.connect()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        versoes = self._versoes(conn)
+        while not self._parar.wait(intervalo):
+            try:
+                atual = conn.execute("PRAGMA data_version").fetchone()[0]
+                if atual == data_version:
+                    continue
+                data_version = atual
+                for chave, versao in self._versoes(conn).items():
+                    if versoes.get(chave) != versao:
+                        versoes[chave] = versao
+                        for callback in self._callbacks.get(chave, ()):
+                            callback()
+            except sqlite3.Error as e:
+                print(f"cache: erro ao verificar versões: {e}")
+        sqlite3.Connection.close(conn)
+
+
+vigia = Vigia()
+vigia.registar("agentes", agentes.invalidar)
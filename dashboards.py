@@ -0,0 +1,172 @@
+"""
+Dashboards: template da página, pré-render comprimido (gzip + hash) e cache LRU
+das páginas mais vistas.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+import assets
+
+CACHE_SIZE = 256  # Páginas em memória
+GZIP_LEVEL = 9  # Comprime-se uma vez, serve-se muitas
+
+DASHBOARD_TEMPLATE = """<!DOCTYPE html>
+<html lang="pt">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{titulo} — QHub</title>
+    <script src="{chart_js}"></script>{live_runtime}
+    <style>
+        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
+        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; background: #f5f5f5; color: #1a1a1a; }}
+        .dashboard-header {{ background: #1a1a2e; color: #fff; padding: 20px 32px; }}
+        .dashboard-header h1 {{ font-size: 22px; font-weight: 600; }}
+        .dashboard-header .meta {{ font-size: 13px; opacity: 0.7; margin-top: 4px; }}
+        .dashboard-body {{ max-width: 1200px; margin: 24px auto; padding: 0 24px; }}
+        .dashboard-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 20px; margin-bottom: 24px; }}
+        .dashboard-row {{ display: flex; gap: 20px; flex-wrap: wrap; margin-bottom: 24px; }}
+        .kpi-card {{ background: linear-gradient(135deg, #1a1a2e, #16213e); color: #fff; border-radius: 12px; padding: 24px; flex: 1; min-width: 180px; }}
+        .kpi-card h3 {{ font-size: 12px; text-transform: uppercase; letter-spacing: 0.5px; opacity: 0.8; margin-bottom: 8px; }}
+        .kpi-card .value {{ font-size: 36px; font-weight: 700; }}
+        .kpi-card .unit {{ font-size: 14px; opacity: 0.7; margin-left: 4px; }}
+        .kpi-card .variation {{ font-size: 12px; margin-top: 8px; opacity: 0.8; }}
+        .chart-container {{ background: #fff; border: 1px solid #e0e0e0; border-radius: 12px; padding: 20px; }}
+        .chart-container h3 {{ font-size: 15px; font-weight: 600; margin-bottom: 16px; color: #1a1a2e; }}
+        .chart-container canvas {{ max-height: 350px; }}
+        .data-table {{ background: #fff; border: 1px solid #e0e0e0; border-radius: 12px; padding: 20px; overflow-x: auto; }}
+        .data-table h3 {{ font-size: 15px; font-weight: 600; margin-bottom: 16px; color: #1a1a2e; }}
+        .data-table table {{ width: 100%; border-collapse: collapse; font-size: 14px; }}
+        .data-table th {{ background: #f5f7fa; padding: 10px 14px; text-align: left; font-weight: 600; border-bottom: 2px solid #e0e0e0; color: #555; }}
+        .data-table td {{ padding: 10px 14px; border-bottom: 1px solid #f0f0f0; }}
+        .data-table tr:hover td {{ background: #f8f9fa; }}
+        .section-title {{ font-size: 18px; font-weight: 600; margin: 32px 0 16px; color: #1a1a2e; }}
+    </style>
+</head>
+<body>
+    <div class="dashboard-header">
+        <h1>{titulo}</h1>
+        <div class="meta">Gerado em {created_at} — QHub Qualidade Industrial</div>
+    </div>
+    <div class="dashboard-body">
+        {html}
+    </div>
+    <script>
+        // Report height to parent for iframe auto-resize
+        function reportHeight() {{
+            var h = document.documentElement.scrollHeight;
+            window.parent.postMessage({{type: 'dashboard-height', height: h}}, '*');
+        }}
+        window.addEventListener('load', reportHeight);
+        window.addEventListener('resize', reportHeight);
+        new MutationObserver(reportHeight).observe(document.body, {{childList: true, subtree: true}});
+        setTimeout(reportHeight, 500);
+        setTimeout(reportHeight, 1500);
+    </script>{live}
+</body>
+</html>"""
+
+
+# Runtime dos dashboards "vivos": vai buscar os resultados dos widgets a /data
+# e aplica-os. <el data-qhub-widget="id" data-qhub-campo="total"> recebe o valor;
+# QHUB.on("id", fn) chama fn(resultado) a cada atualização (ex.: para gráficos).
+# Fica no <head>: os <script>QHUB.on(...)</script> do HTML do modelo correm
+# durante o parse e precisam de QHUB já definido. O refresh fica no fim do body.
+LIVE_RUNTIME = """
+    <script>
+        var QHUB = (function () {
+            var handlers = {};
+            function campo(obj, caminho) {
+                return caminho.split('.').reduce(function (o, k) { return o == null ? o : o[k]; }, obj);
+            }
+            function aplicar(dados) {
+                document.querySelectorAll('[data-qhub-widget]').forEach(function (el) {
+                    var v = campo(dados[el.getAttribute('data-qhub-widget')], el.getAttribute('data-qhub-campo') || 'total');
+                    if (v !== undefined && v !== null) el.textContent = v;
+                });
+                Object.keys(handlers).forEach(function (id) {
+                    if (dados[id]) handlers[id].forEach(function (fn) { fn(dados[id]); });
+                });
+            }
+            function refresh() {
+                return fetch('/dashboards/%(id)s/data').then(function (r) { return r.json(); }).then(aplicar).catch(function () {});
+            }
+            return {
+                on: function (id, fn) { (handlers[id] = handlers[id] || []).push(fn); },
+                refresh: refresh
+            };
+        })();
+    </script>"""
+
+LIVE_REFRESH = """
+    <script>
+        window.addEventListener('load', function () { QHUB.refresh(); setInterval(QHUB.refresh, %(intervalo)d); });
+    </script>"""
+
+LIVE_REFRESH_MS = 60000
+
+
+def render_pagina(dashboard_id: str, titulo: str, html: str, created_at: str, live: bool = False) -> bytes:
+    return DASHBOARD_TEMPLATE.format(
+        titulo=titulo,
+        html=html,
+        created_at=created_at[:16].replace("T", " "),
+        live_runtime=LIVE_RUNTIME % {"id": dashboard_id} if live else "",
+        live=LIVE_REFRESH % {"intervalo": LIVE_REFRESH_MS} if live else "",
+        chart_js=assets.url("vendor/chart.umd.min.js"),
+    ).encode()
+
+
+def comprimir_pagina(pagina: bytes) -> tuple[bytes, str]:
+    """Devolve (gzip, etag). O etag é o hash do conteúdo não comprimido."""
+    # mtime=0: mesmo conteúdo → mesmos bytes
+    return gzip.compress(pagina, GZIP_LEVEL, mtime=0), hashlib.sha256(pagina).hexdigest()[:32]
+
+
+async def guardar_pagina(writer, dashboard_id: str, titulo: str, html: str, created_at: str, live: bool = False):
+    """Pré-render no momento da criação: o GET passa a ser só servir bytes."""
+    gz, etag = comprimir_pagina(render_pagina(dashboard_id, titulo, html, created_at, live))
+    await writer.execute(
+        "INSERT OR REPLACE INTO dashboard_paginas (dashboard_id, etag, gzip) VALUES (?, ?, ?)",
+        (dashboard_id, etag, gz),
+    )
+
+
+class LRU:
+    """Cache LRU thread-safe de páginas (dashboard_id → (etag, gzip))."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._items.get(chave)
+            if item is not None:
+                self._items.move_to_end(chave)
+            return item
+
+    def put(self, chave, valor):
+        with self._lock:
+            self._items[chave] = valor
+            self._items.move_to_end(chave)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._items.clear()
+
+
+cache = LRU(CACHE_SIZE)  # dashboard_id → (etag, gzip)
+widgets_cache = LRU(CACHE_SIZE)  # dashboard_id → lista de widgets
+
+
+def invalidar():
+    """Chamado quando dashboards são apagados (neste ou noutro worker)."""
+    cache.limpar()
+    widgets_cache.limpar()
@@ -2,24 +2,275 @@
 Setup SQLite + helpers para users, agentes e conversas.
 """
 
+import asyncio
+import contextlib
 import sqlite3
 import json
 import os
-import bcrypt
+import queue
+import threading
+import time
 from datetime import datetime
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "qhub.db")
+try:
+    import fcntl
+except ImportError:  # Windows: sem locks entre processos, só modo de um worker
+    fcntl = None
 
+DB_PATH = os.environ.get("QHUB_DB_PATH", os.path.join(os.path.dirname(__file__), "qhub.db"))
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+POOL_SIZE = int(os.environ.get("QHUB_DB_POOL", "16"))  # Ligações inativas mantidas
+STATEMENT_CACHE = 256  # Prepared statements em cache por ligação
+
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",  # Seguro em WAL: só o último commit pode perder-se num crash do SO
+    "PRAGMA cache_size = -20000",  # ~20 MB de page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Ligação cujo close() a devolve ao pool em vez de a fechar."""
+
+    def close(self):
+        _pool_release(self)
+
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+def connect(factory=sqlite3.Connection):
+    """Abre uma ligação nova já afinada (WAL, cache, mmap, busy_timeout)."""
+    conn = sqlite3.connect(
+        DB_PATH,
+        factory=factory,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE,
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+def _pool_release(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        sqlite3.Connection.close(conn)
+
+
+def get_db():
+    """Ligação do pool (ou nova, se o pool estiver vazio). close() devolve-a ao pool."""
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return connect(factory=PooledConnection)
+
+
+def close_pool():
+    while True:
+        try:
+            sqlite3.Connection.close(_pool.get_nowait())
+        except queue.Empty:
+            return
+
+
+# --- Locks entre processos (uvicorn --workers N) ---
+
+
+@contextlib.contextmanager
+def file_lock(caminho: str):
+    """Lock exclusivo entre processos (flock), bloqueante."""
+    with open(caminho, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def try_file_lock(caminho: str):
+    """
+    Tenta o lock sem esperar. Devolve o ficheiro aberto (o lock dura enquanto
+    estiver aberto, ou até o processo morrer) ou None se outro processo o tem.
+    """
+    f = open(caminho, "a+b")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+    return f
+
+
+# --- Escrita em lote (group commit) ---
+
+FLUSH_INTERVAL = 0.005  # Segundos que o writer espera para juntar mais escritas ao lote
+BATCH_MAX = 500
+
+
+class BatchWriter:
+    """
+    Thread única que agrupa INSERTs de todas as conversas em commits partilhados.
+    `await writer.execute(...)` só retorna depois do commit do lote que contém a
+    escrita, por isso quem lê a seguir vê sempre o que escreveu. A ligação do writer
+    usa synchronous = FULL: um commit confirmado sobrevive a um crash do SO, e o
+    fsync por lote (não por escrita) é o que torna isso barato.
+    """
+
+    def __init__(self):
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()  # Enfileirar vs. abortar a thread
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name="qhub-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Grava tudo o que está na fila e termina a thread."""
+        if not self._thread:
+            return
+        self._fila.put(None)
+        self._thread.join()
+        self._thread = None
+
+    async def execute(self, sql: str, params: tuple) -> int:
+        """Enfileira a escrita e espera pelo commit. Devolve o lastrowid."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._lock:
+            ativo = self._thread is not None
+            if ativo:
+                self._fila.put((sql, params, loop, fut))
+        if not ativo:
+            # Sem writer a correr (scripts, arranque, thread abortada): escrita direta
+            conn = get_db()
+            try:
+                cursor = conn.execute(sql, params)
+                conn.commit()
+                return cursor.lastrowid
+            finally:
+                conn.close()
+        return await fut
+
+    def _ligar(self):
+        conn = connect()
+        conn.execute("PRAGMA synchronous = FULL")
+        return conn
+
+    def _abortar(self, erro):
+        """A thread vai morrer: as escritas seguintes passam a diretas e as pendentes falham."""
+        with self._lock:
+            self._thread = None
+            while True:
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    _resolver(item[2], item[3], None, erro)
+
+    def _loop(self):
+        try:
+            conn = self._ligar()
+        except Exception as e:
+            self._abortar(e)
+            return
+        parar = False
+        while not parar:
+            item = self._fila.get()
+            if item is None:
+                break
+            lote = [item]
+            prazo = time.monotonic() + FLUSH_INTERVAL
+            while len(lote) < BATCH_MAX:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    item = self._fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if item is None:
+                    parar = True
+                    break
+                lote.append(item)
+            try:
+                self._gravar(conn, lote)
+            except Exception as e:
+                # Ligação em mau estado (ex.: o rollback falhou): o lote falha e abre-se outra
+                for _, _, loop, fut in lote:
+                    _resolver(loop, fut, None, e)
+                with contextlib.suppress(Exception):
+                    sqlite3.Connection.close(conn)
+                try:
+                    conn = self._ligar()
+                except Exception as e:
+                    self._abortar(e)
+                    return
+        sqlite3.Connection.close(conn)
+
+    def _gravar(self, conn, lote):
+        try:
+            resultados = [conn.execute(sql, params).lastrowid for sql, params, _, _ in lote]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Um INSERT inválido não deve fazer falhar o lote inteiro
+            for sql, params, loop, fut in lote:
+                try:
+                    rowid = conn.execute(sql, params).lastrowid
+                    conn.commit()
+                    _resolver(loop, fut, rowid, None)
+                except Exception as e:
+                    conn.rollback()
+                    _resolver(loop, fut, None, e)
+            return
+        for (_, _, loop, fut), rowid in zip(lote, resultados):
+            _resolver(loop, fut, rowid, None)
+
+
+def _resolver(loop, fut, resultado, erro):
+    def _set():
+        if fut.done():
+            return
+        if erro is not None:
+            fut.set_exception(erro)
+        else:
+            fut.set_result(resultado)
+
+    try:
+        loop.call_soon_threadsafe(_set)
+    except RuntimeError:
+        pass  # Loop já fechado
+
+
+writer = BatchWriter()
+
+
 def init_db():
+    # Com vários workers só um cria, migra e semeia; os outros esperam pelo lock
+    # e encontram tudo feito.
+    with file_lock(DB_PATH + ".init.lock"):
+        _init_db()
+
+
+def _init_db():
     conn = get_db()
+    # WAL é persistente no ficheiro: leitores não bloqueiam o escritor e vice-versa
+    conn.execute("PRAGMA journal_mode = WAL")
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,17 +319,306 @@ def init_db():
     """)
     conn.commit()
 
+    migrate(conn)
+
     if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
         _seed(conn)
 
     conn.close()
 
 
+# --- Migrações ---
+# Lista ordenada de (versão, SQL). A versão aplicada fica em PRAGMA user_version;
+# cada migração corre numa transação própria. Nunca editar uma migração já publicada:
+# acrescentar uma nova.
+
+MIGRATIONS = [
+    (1, """
+        -- Histórico de uma conversa (process_message, listar_mensagens)
+        CREATE INDEX IF NOT EXISTS idx_mensagens_conversa_ts ON mensagens (conversa_id, timestamp);
+        -- Lista de conversas do user: cobre filtro, ordenação e agente_id
+        CREATE INDEX IF NOT EXISTS idx_conversas_user_created ON conversas (user_id, created_at, agente_id);
+        -- Cascatas ao apagar agente / user
+        CREATE INDEX IF NOT EXISTS idx_conversas_agente ON conversas (agente_id);
+        CREATE INDEX IF NOT EXISTS idx_dashboards_user ON dashboards (user_id);
+        CREATE INDEX IF NOT EXISTS idx_user_agentes_agente ON user_agentes (agente_id);
+    """),
+    (2, """
+        -- Arquivo frio: mensagens de conversas inativas, comprimidas (ver archive.py)
+        CREATE TABLE IF NOT EXISTS mensagens_arquivo (
+            conversa_id INTEGER PRIMARY KEY,
+            n_mensagens INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            archived_at TEXT NOT NULL,
+            FOREIGN KEY (conversa_id) REFERENCES conversas(id)
+        );
+        -- HTML de dashboards antigos comprimido (html fica vazio)
+        ALTER TABLE dashboards ADD COLUMN html_z BLOB;
+    """),
+    (3, """
+        -- ON DELETE CASCADE: apagar um user/agente remove tudo o que depende dele.
+        -- SQLite não altera FKs: recriar as tabelas filhas (linhas órfãs ficam de fora).
+        CREATE TABLE user_agentes_new (
+            user_id INTEGER,
+            agente_id INTEGER,
+            PRIMARY KEY (user_id, agente_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (agente_id) REFERENCES agentes(id) ON DELETE CASCADE
+        );
+        INSERT INTO user_agentes_new
+            SELECT * FROM user_agentes
+            WHERE user_id IN (SELECT id FROM users) AND agente_id IN (SELECT id FROM agentes);
+        DROP TABLE user_agentes;
+        ALTER TABLE user_agentes_new RENAME TO user_agentes;
+
+        CREATE TABLE conversas_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            agente_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (agente_id) REFERENCES agentes(id) ON DELETE CASCADE
+        );
+        INSERT INTO conversas_new
+            SELECT * FROM conversas
+            WHERE user_id IN (SELECT id FROM users) AND agente_id IN (SELECT id FROM agentes);
+        -- AUTOINCREMENT: a tabela nova herda o máximo histórico (ids apagados não voltam)
+        DELETE FROM sqlite_sequence WHERE name = 'conversas_new';
+        INSERT INTO sqlite_sequence (name, seq) SELECT 'conversas_new', seq FROM sqlite_sequence WHERE name = 'conversas';
+        DROP TABLE conversas;
+        ALTER TABLE conversas_new RENAME TO conversas;
+
+        CREATE TABLE mensagens_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversa_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            FOREIGN KEY (conversa_id) REFERENCES conversas(id) ON DELETE CASCADE
+        );
+        INSERT INTO mensagens_new
+            SELECT * FROM mensagens WHERE conversa_id IN (SELECT id FROM conversas);
+        -- AUTOINCREMENT: a tabela nova herda o máximo histórico (ids apagados não voltam)
+        DELETE FROM sqlite_sequence WHERE name = 'mensagens_new';
+        INSERT INTO sqlite_sequence (name, seq) SELECT 'mensagens_new', seq FROM sqlite_sequence WHERE name = 'mensagens';
+        DROP TABLE mensagens;
+        ALTER TABLE mensagens_new RENAME TO mensagens;
+
+        CREATE TABLE mensagens_arquivo_new (
+            conversa_id INTEGER PRIMARY KEY,
+            n_mensagens INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            archived_at TEXT NOT NULL,
+            FOREIGN KEY (conversa_id) REFERENCES conversas(id) ON DELETE CASCADE
+        );
+        INSERT INTO mensagens_arquivo_new
+            SELECT * FROM mensagens_arquivo WHERE conversa_id IN (SELECT id FROM conversas);
+        DROP TABLE mensagens_arquivo;
+        ALTER TABLE mensagens_arquivo_new RENAME TO mensagens_arquivo;
+
+        CREATE TABLE dashboards_new (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            titulo TEXT NOT NULL,
+            html TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            html_z BLOB,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        INSERT INTO dashboards_new (id, user_id, titulo, html, created_at, html_z)
+            SELECT id, user_id, titulo, html, created_at, html_z FROM dashboards
+            WHERE user_id IN (SELECT id FROM users);
+        DROP TABLE dashboards;
+        ALTER TABLE dashboards_new RENAME TO dashboards;
+
+        -- Os índices da migração 1 foram-se com as tabelas antigas
+        CREATE INDEX idx_mensagens_conversa_ts ON mensagens (conversa_id, timestamp);
+        CREATE INDEX idx_conversas_user_created ON conversas (user_id, created_at, agente_id);
+        CREATE INDEX idx_conversas_agente ON conversas (agente_id);
+        CREATE INDEX idx_dashboards_user ON dashboards (user_id);
+        CREATE INDEX idx_user_agentes_agente ON user_agentes (agente_id);
+    """),
+    (4, """
+        -- Página completa do dashboard, pré-renderizada e comprimida (ver dashboards.py)
+        CREATE TABLE dashboard_paginas (
+            dashboard_id TEXT PRIMARY KEY,
+            etag TEXT NOT NULL,
+            gzip BLOB NOT NULL,
+            FOREIGN KEY (dashboard_id) REFERENCES dashboards(id) ON DELETE CASCADE
+        );
+    """),
+    (5, """
+        -- Dashboards vivos: JSON [{id, tool, args}] com as consultas por trás dos valores
+        ALTER TABLE dashboards ADD COLUMN widgets TEXT;
+    """),
+    (6, """
+        -- Contador de versão para caches em memória (ver cache.py). Os triggers
+        -- apanham todas as escritas, incluindo as cascatas de ON DELETE.
+        CREATE TABLE cache_versao (
+            chave TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT INTO cache_versao (chave, versao) VALUES ('agentes', 0);
+        CREATE TRIGGER trg_agentes_ins AFTER INSERT ON agentes
+            BEGIN UPDATE cache_versao SET versao = versao + 1 WHERE chave = 'agentes'; END;
+        CREATE TRIGGER trg_agentes_upd AFTER UPDATE ON agentes
+            BEGIN UPDATE cache_versao SET versao = versao + 1 WHERE chave = 'agentes'; END;
+        CREATE TRIGGER trg_agentes_del AFTER DELETE ON agentes
+            BEGIN UPDATE cache_versao SET versao = versao + 1 WHERE chave = 'agentes'; END;
+        CREATE TRIGGER trg_user_agentes_ins AFTER INSERT ON user_agentes
+            BEGIN UPDATE cache_versao SET versao = versao + 1 WHERE chave = 'agentes'; END;
+        CREATE TRIGGER trg_user_agentes_upd AFTER UPDATE ON user_agentes
+            BEGIN UPDATE cache_versao SET versao = versao + 1 WHERE chave = 'agentes'; END;
+        CREATE TRIGGER trg_user_agentes_del AFTER DELETE ON user_agentes
+            BEGIN UPDATE cache_versao SET versao = versao + 1 WHERE chave = 'agentes'; END;
+    """),
+    (7, """
+        -- Multi-worker: remoção de dashboards invalida as caches de páginas de todos
+        -- os processos; o estado dos jobs em background fica visível a qualquer worker.
+        INSERT INTO cache_versao (chave, versao) VALUES ('dashboards', 0);
+        CREATE TRIGGER trg_dashboards_del AFTER DELETE ON dashboards
+            BEGIN UPDATE cache_versao SET versao = versao + 1 WHERE chave = 'dashboards'; END;
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            dono_id INTEGER NOT NULL,
+            estado TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            apagadas INTEGER NOT NULL DEFAULT 0,
+            erro TEXT,
+            criado_em REAL NOT NULL,
+            terminado_em REAL
+        );
+    """),
+    (8, """
+        -- Pesquisa de texto (ver pesquisa.py). `chaves` guarda tokens de filtro
+        -- (u<user_id>, c<conversa_id>, d<dashboard_id>) que entram na própria consulta
+        -- FTS; a relevância só conta a coluna de texto (highlight da coluna 0).
+        -- O rowid de mensagens_fts é o id da mensagem.
+        CREATE VIRTUAL TABLE mensagens_fts USING fts5(
+            content, chaves, conversa_id UNINDEXED, role UNINDEXED, timestamp UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        );
+        CREATE VIRTUAL TABLE dashboards_fts USING fts5(
+            titulo, chaves, dashboard_id UNINDEXED, created_at UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        );
+
+        INSERT INTO mensagens_fts (rowid, content, chaves, conversa_id, role, timestamp)
+            SELECT m.id, m.content, 'u' || c.user_id || ' c' || c.id, c.id, m.role, m.timestamp
+            FROM mensagens m JOIN conversas c ON c.id = m.conversa_id;
+        -- Conversas arquivadas: descomprimidas aqui (descomprimir() é registada em migrate)
+        INSERT INTO mensagens_fts (rowid, content, chaves, conversa_id, role, timestamp)
+            SELECT json_extract(j.value, '$.id'), json_extract(j.value, '$.content'),
+                   'u' || c.user_id || ' c' || c.id, c.id,
+                   json_extract(j.value, '$.role'), json_extract(j.value, '$.timestamp')
+            FROM mensagens_arquivo a JOIN conversas c ON c.id = a.conversa_id,
+                 json_each(descomprimir(a.payload)) j;
+        INSERT INTO dashboards_fts (titulo, chaves, dashboard_id, created_at)
+            SELECT titulo, 'u' || user_id || ' d' || id, id, created_at FROM dashboards;
+
+        CREATE TRIGGER trg_mensagens_fts_ins AFTER INSERT ON mensagens BEGIN
+            -- Restaurar do arquivo volta a inserir ids que já estão no índice
+            DELETE FROM mensagens_fts WHERE rowid = new.id;
+            INSERT INTO mensagens_fts (rowid, content, chaves, conversa_id, role, timestamp)
+                SELECT new.id, new.content, 'u' || user_id || ' c' || id, id, new.role, new.timestamp
+                FROM conversas WHERE id = new.conversa_id;
+        END;
+        CREATE TRIGGER trg_mensagens_fts_upd AFTER UPDATE OF content ON mensagens BEGIN
+            UPDATE mensagens_fts SET content = new.content WHERE rowid = new.id;
+        END;
+        -- Arquivar apaga as mensagens da tabela quente, mas continuam pesquisáveis
+        CREATE TRIGGER trg_mensagens_fts_del AFTER DELETE ON mensagens
+            WHEN NOT EXISTS (SELECT 1 FROM mensagens_arquivo WHERE conversa_id = old.conversa_id)
+        BEGIN
+            DELETE FROM mensagens_fts WHERE rowid = old.id;
+        END;
+        CREATE TRIGGER trg_conversas_fts_del AFTER DELETE ON conversas BEGIN
+            DELETE FROM mensagens_fts WHERE rowid IN (
+                SELECT rowid FROM mensagens_fts WHERE mensagens_fts MATCH ('chaves : "c' || old.id || '"')
+            );
+        END;
+        CREATE TRIGGER trg_dashboards_fts_ins AFTER INSERT ON dashboards BEGIN
+            INSERT INTO dashboards_fts (titulo, chaves, dashboard_id, created_at)
+                VALUES (new.titulo, 'u' || new.user_id || ' d' || new.id, new.id, new.created_at);
+        END;
+        CREATE TRIGGER trg_dashboards_fts_upd AFTER UPDATE OF titulo ON dashboards BEGIN
+            UPDATE dashboards_fts SET titulo = new.titulo WHERE rowid IN (
+                SELECT rowid FROM dashboards_fts WHERE dashboards_fts MATCH ('chaves : "d' || old.id || '"')
+            );
+        END;
+        CREATE TRIGGER trg_dashboards_fts_del AFTER DELETE ON dashboards BEGIN
+            DELETE FROM dashboards_fts WHERE rowid IN (
+                SELECT rowid FROM dashboards_fts WHERE dashboards_fts MATCH ('chaves : "d' || old.id || '"')
+            );
+        END;
+    """),
+    (9, """
+        -- O runtime dos dashboards vivos passou para o <head> (os QHUB.on inline
+        -- corriam antes de QHUB existir): as páginas vivas voltam a ser geradas no GET
+        DELETE FROM dashboard_paginas WHERE dashboard_id IN (SELECT id FROM dashboards WHERE widgets IS NOT NULL);
+    """),
+]
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _statements(sql):
+    """Parte um script em statements (respeita ; dentro de triggers BEGIN ... END)."""
+    atual = ""
+    for parte in sql.split(";"):
+        atual += parte + ";"
+        if sqlite3.complete_statement(atual):
+            if atual.strip(" \n;"):
+                yield atual
+            atual = ""
+
+
+def migrate(conn):
+    """Aplica as migrações com versão acima de PRAGMA user_version."""
+    atual = schema_version(conn)
+    if atual >= MIGRATIONS[-1][0]:
+        return
+    # Recriar tabelas exige FKs desligadas (só muda fora de transações); antes de
+    # cada commit, foreign_key_check não pode ter violações novas (as órfãs de
+    # bases antigas só desaparecem na migração 3).
+    conn.execute("PRAGMA foreign_keys = OFF")
+    # Migração 8 indexa o payload (zlib) das conversas arquivadas
+    from archive import descomprimir
+    conn.create_function("descomprimir", 1, descomprimir, deterministic=True)
+    try:
+        for versao, sql in MIGRATIONS:
+            if versao <= atual:
+                continue
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                # Outro processo pode ter migrado enquanto esperávamos pelo lock
+                if schema_version(conn) >= versao:
+                    conn.rollback()
+                    continue
+                antes = set(conn.execute("PRAGMA foreign_key_check").fetchall())
+                for stmt in _statements(sql):
+                    conn.execute(stmt)
+                if set(conn.execute("PRAGMA foreign_key_check").fetchall()) - antes:
+                    raise sqlite3.IntegrityError(f"Migração {versao} viola foreign keys")
+                conn.execute(f"PRAGMA user_version = {versao}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+
 def _seed(conn):
     # --- Users ---
-    maria_hash = bcrypt.hashpw(b"maria123", bcrypt.gensalt()).decode()
-    rui_hash = bcrypt.hashpw(b"rui123", bcrypt.gensalt()).decode()
-    admin_hash = bcrypt.hashpw(b"admin123", bcrypt.gensalt()).decode()
+    # Hashes bcrypt (custo 12) pré-calculados de maria123 / rui123 / admin123:
+    # gerá-los no arranque custava ~0.75 s de CPU ao primeiro worker
+    maria_hash = "$2b$12$yirdpf2NgONDe3jpwaeO6.mN2Q3yLzGf8lzDePhu7NbnsWDiZq0Ua"
+    rui_hash = "$2b$12$yHlGjTcFLDdCS2yHLbb18edLpB1R9GyTN6cSIKDaJKdT/.mLqwGzq"
+    admin_hash = "$2b$12$h5GeR5yt39A5ZZX6G6wwYuoPZmJacSRCs1fHDjR7lneZzgDMkZ3pm"
 
     conn.execute(
         "INSERT INTO users (nome, email, password_hash, role) VALUES (?, ?, ?, ?)",
@@ -103,7 +643,9 @@ def _seed(conn):
         "e sugestões práticas para o operador no chão de fábrica.\n\n"
         "VISUALIZAÇÃO:\n"
         "- Para respostas rápidas no chat: usa gerar_kpi, gerar_grafico e gerar_tabela.\n"
-        "- Quando o utilizador pedir um relatório, dashboard ou análise completa: usa gerar_dashboard.\n\n"
+        "- Quando o utilizador pedir um relatório, dashboard ou análise completa: usa gerar_dashboard.\n"
+        "- Quando o utilizador pedir os dados em bruto, uma listagem longa ou um ficheiro: usa exportar_defeitos "
+        "(devolve um link de download; não copies os registos para gerar_tabela).\n\n"
         "DASHBOARDS (gerar_dashboard):\n"
         "Gera HTML completo para uma página de dashboard. O HTML é inserido dentro de um template que já inclui "
         "Chart.js e estilos base. Escreve o conteúdo HTML do <body>: divs, canvas para gráficos, tabelas, KPIs. "
@@ -120,7 +662,9 @@ def _seed(conn):
         "correlações entre tipos de defeito e materiais, e recomendações baseadas nos dados.\n\n"
         "VISUALIZAÇÃO:\n"
         "- Para respostas rápidas no chat: usa gerar_kpi, gerar_grafico e gerar_tabela.\n"
-        "- Quando o utilizador pedir um relatório, dashboard ou análise completa: usa gerar_dashboard.\n\n"
+        "- Quando o utilizador pedir um relatório, dashboard ou análise completa: usa gerar_dashboard.\n"
+        "- Quando o utilizador pedir os dados em bruto, uma listagem longa ou um ficheiro: usa exportar_defeitos "
+        "(devolve um link de download; não copies os registos para gerar_tabela).\n\n"
         "DASHBOARDS (gerar_dashboard):\n"
         "Gera HTML completo para uma página de dashboard. O HTML é inserido dentro de um template que já inclui "
         "Chart.js e estilos base. Escreve o conteúdo HTML do <body>: divs, canvas para gráficos, tabelas, KPIs. "
@@ -131,14 +675,14 @@ def _seed(conn):
 
     conn.execute(
         "INSERT INTO agentes (nome, system_prompt, tools) VALUES (?, ?, ?)",
-        ("Qualidade", qualidade_prompt, json.dumps(["contar_defeitos", "top_defeitos", "gerar_grafico", "gerar_tabela", "gerar_kpi", "gerar_dashboard"])),
+        ("Qualidade", qualidade_prompt, json.dumps(["contar_defeitos", "top_defeitos", "exportar_defeitos", "gerar_grafico", "gerar_tabela", "gerar_kpi", "gerar_dashboard"])),
     )
     conn.execute(
         "INSERT INTO agentes (nome, system_prompt, tools) VALUES (?, ?, ?)",
         (
             "Análise",
             analise_prompt,
-            json.dumps(["contar_defeitos", "top_defeitos", "defeitos_por_turno", "gerar_grafico", "gerar_tabela", "gerar_kpi", "gerar_dashboard"]),
+            json.dumps(["contar_defeitos", "top_defeitos", "defeitos_por_turno", "exportar_defeitos", "gerar_grafico", "gerar_tabela", "gerar_kpi", "gerar_dashboard"]),
         ),
     )
 
@@ -0,0 +1,177 @@
+"""
+Exportação em massa dos defeitos: linhas filtradas ou contagens por grupo, em CSV
+ou NDJSON, lidas do store (colunas mmap) e enviadas aos blocos. A memória não
+depende do nº de linhas e os dados não passam pelo modelo.
+
+Um pedido é um dict normalizado (ver `pedido`), o mesmo que vai assinado nos
+links de download da tool exportar_defeitos.
+
+    python exportar.py --turno noite --agrupar tipo_defeito,material > noite.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from collections import Counter
+
+import store
+
+FORMATOS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+COLUNA_DATA = "data"  # Aceita intervalo (data_de / data_ate, inclusivo, AAAA-MM-DD)
+LOTE = 8192  # Linhas lidas e enviadas de cada vez
+
+
+def pedido(formato: str = "csv", filtros: dict | None = None, agrupar: list | None = None,
+           data_de: str | None = None, data_ate: str | None = None) -> dict:
+    """Valida e normaliza um pedido contra as colunas do store. ValueError se for inválido."""
+    s = store.obter()
+    colunas = s.colunas
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato} (usa {', '.join(FORMATOS)})")
+    normalizados = {}
+    for nome, valores in (filtros or {}).items():
+        if nome not in colunas:
+            raise ValueError(f"Coluna desconhecida: {nome}")
+        valores = [valores] if isinstance(valores, (str, int)) else list(valores)
+        normalizados[nome] = sorted({str(v) for v in valores})
+    agrupar = list(dict.fromkeys(agrupar or []))
+    for nome in agrupar:
+        if nome not in colunas:
+            raise ValueError(f"Coluna desconhecida: {nome}")
+    if data_de or data_ate:
+        if COLUNA_DATA not in colunas:
+            raise ValueError(f"Sem coluna {COLUNA_DATA} para filtrar por intervalo")
+        if s.coluna(COLUNA_DATA)[1] is None:
+            raise ValueError(f"Intervalo não suportado na coluna {COLUNA_DATA}")
+    return {
+        "formato": formato,
+        "filtros": normalizados,
+        "agrupar": agrupar,
+        "data_de": data_de or None,
+        "data_ate": data_ate or None,
+    }
+
+
+def nome_ficheiro(p: dict) -> str:
+    sufixo = "-por-" + "-".join(p["agrupar"]) if p["agrupar"] else ""
+    return f"defeitos{sufixo}-{time.strftime('%Y%m%d-%H%M%S')}.{p['formato']}"
+
+
+def desconhecidos(p: dict) -> list[str]:
+    """Valores de filtro que não aparecem nos dados (ajuda o modelo a corrigir gralhas)."""
+    s = store.obter()
+    avisos = []
+    for nome, valores in p["filtros"].items():
+        _, dicionario = s.coluna(nome)
+        if dicionario is not None:
+            avisos += [f"{nome}={v}" for v in valores if v not in dicionario]
+    return avisos
+
+
+# --- Leitura ---
+
+
+def _condicoes(s: store.DefectStore, p: dict) -> list[tuple]:
+    """(códigos da coluna, códigos aceites), das mais seletivas para as menos."""
+    condicoes = []
+    intervalo = (p["data_de"], p["data_ate"]) if p["data_de"] or p["data_ate"] else None
+    nomes = set(p["filtros"]) | ({COLUNA_DATA} if intervalo else set())
+    for nome in nomes:
+        codigos, dicionario = s.coluna(nome)
+        valores = p["filtros"].get(nome)
+        if dicionario is None:
+            # Coluna de inteiros sem dicionário: os códigos são os próprios valores
+            aceites = {int(v) for v in valores if v.lstrip("-").isdigit()}
+            condicoes.append((codigos, aceites, 0.0))
+            continue
+        de, ate = intervalo or (None, None)
+        if nome != COLUNA_DATA:
+            de = ate = None
+        aceites = {
+            i for i, v in enumerate(dicionario)
+            if (valores is None or v in valores) and (de is None or v >= de) and (ate is None or v <= ate)
+        }
+        condicoes.append((codigos, aceites, len(aceites) / max(1, len(dicionario))))
+    condicoes.sort(key=lambda c: c[2])
+    return [(codigos, aceites) for codigos, aceites, _ in condicoes]
+
+
+def _indices(condicoes: list[tuple], inicio: int, fim: int):
+    """Linhas do bloco [inicio, fim) que passam todos os filtros."""
+    if not condicoes:
+        return range(inicio, fim)
+    (codigos, aceites), resto = condicoes[0], condicoes[1:]
+    if not aceites:
+        return []
+    indices = [i for i, c in zip(range(inicio, fim), codigos[inicio:fim]) if c in aceites]
+    for codigos, aceites in resto:
+        indices = [i for i in indices if codigos[i] in aceites]
+    return indices
+
+
+def _descodificar(codigos, dicionario, indices) -> list[str]:
+    valores = map(codigos.__getitem__, indices) if not isinstance(indices, range) else codigos[indices.start:indices.stop]
+    return list(map(dicionario.__getitem__, valores) if dicionario is not None else map(str, valores))
+
+
+def _serializar(formato: str, nomes: list[str]):
+    """Função (lista de linhas) → texto, no formato pedido."""
+    if formato == "ndjson":
+        return lambda linhas: "".join(json.dumps(dict(zip(nomes, l)), ensure_ascii=False) + "\n" for l in linhas)
+    buf = io.StringIO()
+    escritor = csv.writer(buf, lineterminator="\n")
+
+    def _csv(linhas):
+        buf.seek(0)
+        buf.truncate()
+        escritor.writerows(linhas)
+        return buf.getvalue()
+    return _csv
+
+
+def gerar(p: dict):
+    """Gerador do ficheiro exportado, aos blocos (StreamingResponse corre-o numa thread)."""
+    s = store.obter()  # O snapshot fica fixo durante a exportação, mesmo que o CSV mude
+    condicoes = _condicoes(s, p)
+
+    if p["agrupar"]:
+        grupo = [s.coluna(nome) for nome in p["agrupar"]]
+        contagem = Counter()
+        for inicio in range(0, s.linhas, LOTE):
+            indices = _indices(condicoes, inicio, min(inicio + LOTE, s.linhas))
+            contagem.update(zip(*(_descodificar(c, d, indices) for c, d in grupo)))
+        nomes = p["agrupar"] + ["total"]
+        serializar = _serializar(p["formato"], nomes)
+        if p["formato"] == "csv":
+            yield serializar([nomes])
+        ordenado = contagem.most_common()
+        for inicio in range(0, len(ordenado), LOTE):
+            yield serializar([(*chave, total) for chave, total in ordenado[inicio:inicio + LOTE]])
+        return
+
+    nomes = s.colunas
+    colunas = [s.coluna(nome) for nome in nomes]
+    serializar = _serializar(p["formato"], nomes)
+    if p["formato"] == "csv":
+        yield serializar([nomes])
+    for inicio in range(0, s.linhas, LOTE):
+        indices = _indices(condicoes, inicio, min(inicio + LOTE, s.linhas))
+        if indices:
+            yield serializar(zip(*(_descodificar(c, d, indices) for c, d in colunas)))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Exporta defeitos filtrados (ou agregados) para o stdout")
+    ap.add_argument("--formato", default="csv", choices=sorted(FORMATOS))
+    ap.add_argument("--agrupar", default="", help="Colunas separadas por vírgula")
+    ap.add_argument("--data-de")
+    ap.add_argument("--data-ate")
+    args, resto = ap.parse_known_args()
+    # Filtros livres: --turno noite --tipo_defeito lixo,crateras
+    filtros = {resto[i].lstrip("-"): resto[i + 1].split(",") for i in range(0, len(resto) - 1, 2)}
+    p = pedido(args.formato, filtros, [c for c in args.agrupar.split(",") if c], args.data_de, args.data_ate)
+    for parte in gerar(p):
+        sys.stdout.write(parte)
@@ -0,0 +1,164 @@
+"""
+Remoção em background de users/agentes com muitos dados: apaga em lotes
+pequenos (cada um com commit próprio) para nunca bloquear os chats ativos.
+O estado dos jobs fica na tabela `jobs`, visível a qualquer worker.
+"""
+
+import threading
+import time
+import uuid
+
+import cache
+import dashboards
+from db import get_db
+
+CHUNK = 2000  # Linhas por lote
+LIMIAR = 10000  # Acima deste nº de mensagens a remoção passa para background
+PAUSA = 0.01  # Segundos entre lotes: deixa passar os writers dos chats
+
+# Para cada tipo de dono: tabela, coluna na tabela conversas/dashboards/user_agentes
+_DONOS = {
+    "user": {"tabela": "users", "coluna": "user_id"},
+    "agente": {"tabela": "agentes", "coluna": "agente_id"},
+}
+
+def contar_mensagens(conn, tipo: str, dono_id: int) -> int:
+    """Mensagens do dono, ativas e arquivadas (as arquivadas também têm linhas no FTS)."""
+    coluna = _DONOS[tipo]["coluna"]
+    return conn.execute(
+        f"""
+        SELECT
+            (SELECT COUNT(*) FROM mensagens m JOIN conversas c ON c.id = m.conversa_id WHERE c.{coluna} = ?)
+          + (SELECT COALESCE(SUM(a.n_mensagens), 0) FROM mensagens_arquivo a
+             JOIN conversas c ON c.id = a.conversa_id WHERE c.{coluna} = ?)
+        """,
+        (dono_id, dono_id),
+    ).fetchone()[0]
+
+
+def apagar(conn, tipo: str, dono_id: int):
+    """Remoção set-based: um DELETE do dono, o resto vai por ON DELETE CASCADE."""
+    conn.execute(f"DELETE FROM {_DONOS[tipo]['tabela']} WHERE id = ?", (dono_id,))
+    conn.commit()
+
+
+def _gravar(conn, job: dict):
+    """Atualiza o progresso na tabela jobs (o commit é do chamador)."""
+    conn.execute(
+        "UPDATE jobs SET estado = ?, apagadas = ?, erro = ?, terminado_em = ? WHERE id = ?",
+        (job["estado"], job["apagadas"], job["erro"], job["terminado_em"], job["id"]),
+    )
+
+
+def _apagar_em_lotes(conn, sql: str, params: tuple, job: dict):
+    while True:
+        n = conn.execute(sql, (*params, CHUNK)).rowcount
+        job["apagadas"] += n
+        _gravar(conn, job)
+        conn.commit()
+        if n < CHUNK:
+            return
+        time.sleep(PAUSA)
+
+
+def _correr(job: dict):
+    tipo, dono_id = job["tipo"], job["dono_id"]
+    coluna = _DONOS[tipo]["coluna"]
+    conn = get_db()
+    try:
+        # Cortar o acesso primeiro: não se criam conversas novas durante a remoção
+        conn.execute(f"DELETE FROM user_agentes WHERE {coluna} = ?", (dono_id,))
+        conn.commit()
+        cache.agentes.invalidar()
+        _apagar_em_lotes(
+            conn,
+            f"""
+            DELETE FROM mensagens WHERE id IN (
+                SELECT m.id FROM mensagens m JOIN conversas c ON c.id = m.conversa_id
+                WHERE c.{coluna} = ? LIMIT ?
+            )
+            """,
+            (dono_id,),
+            job,
+        )
+        # Conversas arquivadas: as mensagens só existem no payload e no índice FTS.
+        # O índice sai em lotes; senão o trigger de DELETE em conversas removia-o
+        # todo de uma vez, numa só transação.
+        arquivadas = [
+            r[0] for r in conn.execute(
+                f"SELECT a.conversa_id FROM mensagens_arquivo a JOIN conversas c ON c.id = a.conversa_id WHERE c.{coluna} = ?",
+                (dono_id,),
+            )
+        ]
+        for conversa_id in arquivadas:
+            _apagar_em_lotes(
+                conn,
+                """
+                DELETE FROM mensagens_fts WHERE rowid IN (
+                    SELECT rowid FROM mensagens_fts WHERE mensagens_fts MATCH ? LIMIT ?
+                )
+                """,
+                (f'chaves : "c{conversa_id}"',),
+                job,
+            )
+            conn.execute("DELETE FROM mensagens_arquivo WHERE conversa_id = ?", (conversa_id,))
+            conn.commit()
+        _apagar_em_lotes(
+            conn,
+            f"DELETE FROM conversas WHERE id IN (SELECT id FROM conversas WHERE {coluna} = ? LIMIT ?)",
+            (dono_id,),
+            job,
+        )
+        if tipo == "user":
+            _apagar_em_lotes(
+                conn,
+                "DELETE FROM dashboards WHERE rowid IN (SELECT rowid FROM dashboards WHERE user_id = ? LIMIT ?)",
+                (dono_id,),
+                job,
+            )
+        apagar(conn, tipo, dono_id)
+        dashboards.invalidar()
+        cache.agentes.invalidar()
+        job["estado"] = "concluido"
+    except Exception as e:
+        conn.rollback()
+        job["estado"] = "erro"
+        job["erro"] = str(e)
+    finally:
+        job["terminado_em"] = time.time()
+        _gravar(conn, job)
+        conn.commit()
+        conn.close()
+
+
+def apagar_em_background(tipo: str, dono_id: int, total: int) -> dict:
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "tipo": tipo,
+        "dono_id": dono_id,
+        "estado": "a_correr",
+        "total": total,  # Estimativa: mensagens (conversas e dashboards somam-se a apagadas)
+        "apagadas": 0,
+        "erro": None,
+        "criado_em": time.time(),
+        "terminado_em": None,
+    }
+    conn = get_db()
+    conn.execute(
+        """
+        INSERT INTO jobs (id, tipo, dono_id, estado, total, apagadas, erro, criado_em, terminado_em)
+        VALUES (:id, :tipo, :dono_id, :estado, :total, :apagadas, :erro, :criado_em, :terminado_em)
+        """,
+        job,
+    )
+    conn.commit()
+    conn.close()
+    threading.Thread(target=_correr, args=(job,), name=f"qhub-job-{job['id']}", daemon=True).start()
+    return job
+
+
+def obter(job_id: str) -> dict | None:
+    conn = get_db()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
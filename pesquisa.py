@@ -0,0 +1,176 @@
+"""
+Pesquisa de texto no histórico de conversas e nos títulos de dashboards (FTS5).
+
+Os índices `mensagens_fts` e `dashboards_fts` (migração 8) são mantidos por
+triggers, incluindo as mensagens de conversas arquivadas. Cada documento traz o
+token `u<user_id>` na coluna `chaves`: o filtro de permissões faz parte da
+consulta FTS e só se leem documentos do próprio user.
+
+Ordenação: o bm25() do FTS5 percorre a lista completa de cada termo (de todos os
+users) para calcular o IDF, o que com milhões de mensagens custa dezenas de ms.
+Aqui lêem-se só as JANELA_RANK ocorrências mais recentes (a leitura por rowid
+DESC para aí) e ordenam-se com BM25 sem IDF — com AND implícito todos os
+candidatos têm todos os termos, por isso o IDF pouco mudava a ordem.
+
+Cada resposta diz se há mais páginas na janela (`mais`) e, se a janela encheu,
+traz o cursor `antes` da janela seguinte (ocorrências mais antigas).
+
+    python pesquisa.py --user 2 "crateras R11"
+"""
+
+import argparse
+import re
+
+LIMITE_MAX = 100
+JANELA_RANK = 500  # Ocorrências mais recentes candidatas à ordenação por relevância
+EXCERTO_PALAVRAS = 16  # Tamanho máximo do excerto
+MARCAS = ("«", "»")  # Delimitam os termos encontrados no excerto
+K1, B = 1.2, 0.75  # Parâmetros do BM25 (os mesmos do bm25() do FTS5)
+
+_TERMO = re.compile(r"\w+\*?")  # Palavras; um * final pesquisa por prefixo
+_OCORRENCIA = re.compile("\x01(.*?)\x02", re.S)
+
+
+def consulta_fts(texto: str, coluna: str) -> str | None:
+    """
+    Converte o texto do user numa consulta FTS5 segura: cada palavra passa a um
+    termo entre aspas (AND implícito), sem operadores nem sintaxe do user.
+    """
+    termos = []
+    for t in _TERMO.findall(texto):
+        prefixo = t.endswith("*")
+        termos.append(f'{coluna} : "{t.rstrip("*")}"' + (" *" if prefixo else ""))
+    return " AND ".join(termos) or None
+
+
+def _match(user_id: int, consulta: str) -> str:
+    return f'chaves : "u{user_id}" AND {consulta}'
+
+
+def _candidatos(conn, tabela: str, colunas: str, match: str, antes: int | None) -> tuple[list, int | None]:
+    """
+    As ocorrências mais recentes (abaixo do rowid `antes`), com o texto marcado
+    (\\x01 termo \\x02), e o cursor da janela seguinte (None se não houver mais).
+    """
+    cursor = "AND rowid < ?" if antes is not None else ""
+    rows = conn.execute(
+        f"""
+        SELECT rowid, {colunas}, highlight({tabela}, 0, char(1), char(2)) AS marcado
+        FROM {tabela}
+        WHERE {tabela} MATCH ? {cursor}
+        ORDER BY rowid DESC
+        LIMIT ?
+        """,
+        (match,) + ((antes,) if antes is not None else ()) + (JANELA_RANK + 1,),
+    ).fetchall()
+    if len(rows) > JANELA_RANK:
+        return rows[:JANELA_RANK], rows[JANELA_RANK - 1]["rowid"]
+    return rows, None
+
+
+def _ordenar(rows: list) -> list[tuple[float, object]]:
+    """(score, row) por relevância; empates ficam com o mais recente."""
+    if not rows:
+        return []
+    docs = []
+    for r in rows:
+        marcado = r["marcado"]
+        tf = {}
+        for o in _OCORRENCIA.findall(marcado.casefold()):
+            tf[o] = tf.get(o, 0) + 1
+        docs.append((r, tf.values(), len(marcado)))
+    media = sum(d[2] for d in docs) / len(docs)
+    ordenados = []
+    for r, tf, tamanho in docs:
+        norma = K1 * (1 - B + B * tamanho / media)
+        ordenados.append((sum(f * (K1 + 1) / (f + norma) for f in tf), r))
+    ordenados.sort(key=lambda x: -x[0])  # Estável: os candidatos vêm do mais recente
+    return ordenados
+
+
+def _excerto(marcado: str) -> str:
+    """
+    Até EXCERTO_PALAVRAS palavras à volta da 1ª ocorrência. Feito aqui a partir do
+    highlight: o snippet() obrigava a 2ª consulta (rowid IN ...), que com prefixos
+    refaz a lista do prefixo por cada linha.
+    """
+    palavras = marcado.split()
+    i = next((k for k, p in enumerate(palavras) if "\x01" in p), 0)
+    inicio = max(0, min(i - EXCERTO_PALAVRAS // 4, len(palavras) - EXCERTO_PALAVRAS))
+    trecho = " ".join(palavras[inicio:inicio + EXCERTO_PALAVRAS])
+    if trecho.count("\x01") > trecho.count("\x02"):  # Ocorrência cortada no fim
+        trecho += "\x02"
+    trecho = ("…" if inicio > 0 else "") + trecho + ("…" if inicio + EXCERTO_PALAVRAS < len(palavras) else "")
+    return _marcar(trecho)
+
+
+def _marcar(texto: str) -> str:
+    return texto.replace("\x01", MARCAS[0]).replace("\x02", MARCAS[1])
+
+
+def _pagina(ordenados: list, limit: int, offset: int, seguinte: int | None, itens: list) -> dict:
+    return {
+        "resultados": itens,
+        "mais": offset + limit < len(ordenados),  # Mais páginas nesta janela
+        "antes": seguinte,  # Janela cheia: cursor para as ocorrências mais antigas
+    }
+
+
+def pesquisar_mensagens(conn, user_id: int, texto: str, limit: int = 20, offset: int = 0,
+                        antes: int | None = None) -> dict:
+    """Página `offset`..`offset+limit` (dentro de JANELA_RANK) das mensagens do user."""
+    consulta = consulta_fts(texto, "content")
+    if consulta is None:
+        return _pagina([], limit, offset, None, [])
+    candidatos, seguinte = _candidatos(
+        conn, "mensagens_fts", "conversa_id, role, timestamp", _match(user_id, consulta), antes
+    )
+    ordenados = _ordenar(candidatos)
+    return _pagina(ordenados, limit, offset, seguinte, [
+        {
+            "mensagem_id": r["rowid"],
+            "conversa_id": r["conversa_id"],
+            "role": r["role"],
+            "timestamp": r["timestamp"],
+            "excerto": _excerto(r["marcado"]),
+            "score": round(score, 4),
+        }
+        for score, r in ordenados[offset:offset + limit]
+    ])
+
+
+def pesquisar_dashboards(conn, user_id: int, texto: str, limit: int = 20, offset: int = 0,
+                         antes: int | None = None) -> dict:
+    consulta = consulta_fts(texto, "titulo")
+    if consulta is None:
+        return _pagina([], limit, offset, None, [])
+    candidatos, seguinte = _candidatos(
+        conn, "dashboards_fts", "dashboard_id, titulo, created_at", _match(user_id, consulta), antes
+    )
+    ordenados = _ordenar(candidatos)
+    return _pagina(ordenados, limit, offset, seguinte, [
+        {
+            "dashboard_id": r["dashboard_id"],
+            "titulo": r["titulo"],
+            "created_at": r["created_at"],
+            "excerto": _marcar(r["marcado"]),
+            "score": round(score, 4),
+        }
+        for score, r in ordenados[offset:offset + limit]
+    ])
+
+
+if __name__ == "__main__":
+    from db import get_db
+
+    ap = argparse.ArgumentParser(description="Pesquisa no histórico de um user")
+    ap.add_argument("--user", type=int, required=True)
+    ap.add_argument("--limit", type=int, default=10)
+    ap.add_argument("texto")
+    args = ap.parse_args()
+    conn = get_db()
+    for m in pesquisar_mensagens(conn, args.user, args.texto, args.limit)["resultados"]:
+        print(f"[conversa {m['conversa_id']} · {m['role']} · {m['timestamp'][:16]}] {m['excerto']}")
+    for d in pesquisar_dashboards(conn, args.user, args.texto, args.limit)["resultados"]:
+        print(f"[dashboard {d['dashboard_id']}] {d['excerto']}")
+    conn.close()
@@ -2,28 +2,101 @@
 FastAPI — endpoints API + serve frontend.
 """
 
+import arranque  # Primeiro: o relógio do arranque conta os imports seguintes
+
+import asyncio
+import gzip
 import json
+import os
+import socket
 
-import bcrypt
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, HTTPException, Depends, Header, Query
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from datetime import datetime
 from pydantic import BaseModel
 from typing import Optional
 
-from db import init_db, get_db
-from auth import authenticate, verify_token
-from agent_engine import process_message, TOOL_DEFINITIONS
+from db import init_db, get_db, close_pool, writer
+from auth import authenticate, verify_token, hash_password, iniciar_pool, shutdown_pool, verificar_exportacao
+from agent_engine import process_message, TOOL_DEFINITIONS, avaliar_widgets, get_client
+import streams
+import archive
+import jobs
+import dashboards
+import assets
+import cache
+import store
+import pesquisa
+import exportar
 
 app = FastAPI(title="QHub PoC")
+arranque.marco("imports")
+
+# Dashboards apagados noutro worker também saem das caches deste
+cache.vigia.registar("dashboards", dashboards.invalidar)
 
 
 # --- Startup ---
 
+def _tcp_nodelay_na_escuta():
+    """
+    Com `--workers N` o uvicorn cria o socket de escuta com proto=0 e o asyncio só
+    liga TCP_NODELAY quando proto é IPPROTO_TCP: cada resposta (cabeçalhos + corpo)
+    esperaria ~40 ms pelo delayed ACK do cliente. Ligado no socket de escuta, as
+    ligações aceites herdam-no.
+    """
+    try:
+        fds = [int(fd) for fd in os.listdir("/proc/self/fd")]
+    except OSError:
+        return  # Sem /proc (macOS, Windows)
+    for fd in fds:
+        try:
+            sock = socket.socket(fileno=fd)
+        except OSError:
+            continue
+        try:
+            if sock.family in (socket.AF_INET, socket.AF_INET6) and sock.type == socket.SOCK_STREAM:
+                try:
+                    sock.getpeername()
+                except OSError:
+                    # Sem par: é o socket de escuta (pode ainda não ter feito listen())
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        finally:
+            sock.detach()
+
+
 @app.on_event("startup")
 def startup():
-    init_db()
+    _tcp_nodelay_na_escuta()
+    with arranque.fase("init_db"):
+        init_db()
+    with arranque.fase("assets"):
+        assets.carregar()
+    writer.start()
+    cache.vigia.start()
+    archive.iniciar_job()
+    with arranque.fase("hash_pool"):
+        iniciar_pool()
+    # O que é lento e só faz falta mais tarde carrega em background: o snapshot dos
+    # defeitos (as tools esperam por ele se chegarem primeiro) e o SDK da Anthropic
+    arranque.em_background("store", store.obter)
+    arranque.em_background("anthropic", get_client, bloqueia_ready=False)
+    arranque.startup_concluido()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    writer.stop()  # Grava o que ainda estiver na fila
+    cache.vigia.stop()
+    close_pool()
+    shutdown_pool()
+
+
+@app.get("/ready")
+async def ready():
+    """Prontidão do worker (para o load balancer) e tempos de cada fase do arranque."""
+    relatorio = arranque.relatorio()
+    return JSONResponse(status_code=200 if relatorio["pronto"] else 503, content=relatorio)
 
 
 # --- Auth dependency ---
@@ -66,7 +139,7 @@ class UserAgentesRequest(BaseModel):
 
 @app.post("/auth/login")
 async def login(body: LoginRequest):
-    result = authenticate(body.email, body.password)
+    result = await authenticate(body.email, body.password)
     if not result:
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
     return result
@@ -75,15 +148,7 @@ async def login(body: LoginRequest):
 @app.get("/agentes")
 async def listar_agentes(user: dict = Depends(get_current_user)):
     conn = get_db()
-    agentes = conn.execute(
-        """
-        SELECT a.id, a.nome
-        FROM agentes a
-        JOIN user_agentes ua ON ua.agente_id = a.id
-        WHERE ua.user_id = ?
-        """,
-        (user["user_id"],),
-    ).fetchall()
+    agentes = cache.agentes.agentes_do_user(conn, user["user_id"])
     conn.close()
     return [{"id": a["id"], "nome": a["nome"]} for a in agentes]
 
@@ -97,11 +162,7 @@ async def criar_conversa(request: Request, user: dict = Depends(get_current_user
 
     conn = get_db()
     # Verificar permissão
-    perm = conn.execute(
-        "SELECT 1 FROM user_agentes WHERE user_id = ? AND agente_id = ?",
-        (user["user_id"], agente_id),
-    ).fetchone()
-    if not perm:
+    if not cache.agentes.tem_acesso(conn, user["user_id"], agente_id):
         conn.close()
         raise HTTPException(status_code=403, detail="Sem acesso a este agente")
 
@@ -116,20 +177,76 @@ async def criar_conversa(request: Request, user: dict = Depends(get_current_user
     return {"id": conversa_id, "agente_id": agente_id, "created_at": now}
 
 
+# --- Paginação (keyset) ---
+# Cursores são ids: `before` devolve os `limit` anteriores ao id, `after` os seguintes.
+# A ordem é (timestamp|created_at, id), servida diretamente pelos índices da migração 1.
+
+PAGE_DEFAULT = 100
+PAGE_MAX = 1000
+
+
+def _validar_cursor(before: Optional[int], after: Optional[int]):
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Usa before ou after, não ambos")
+
+
+def _keyset_sql(tabela: str, coluna_ts: str, before, after, alias: str = "") -> tuple[str, str, tuple]:
+    """Devolve (condição, ORDER BY, params). `after` lê por ordem ascendente, o resto descendente."""
+    chave = f"({alias}{coluna_ts}, {alias}id)"
+    if after is not None:
+        return (
+            f"AND {chave} > (SELECT {coluna_ts}, id FROM {tabela} WHERE id = ?)",
+            f"{alias}{coluna_ts}, {alias}id", (after,),
+        )
+    if before is not None:
+        return (
+            f"AND {chave} < (SELECT {coluna_ts}, id FROM {tabela} WHERE id = ?)",
+            f"{alias}{coluna_ts} DESC, {alias}id DESC", (before,),
+        )
+    return "", f"{alias}{coluna_ts} DESC, {alias}id DESC", ()
+
+
+def _keyset_lista(items: list[dict], limit: int, before, after) -> list[dict]:
+    """Mesma semântica que o keyset SQL, sobre uma lista já ordenada (conversas arquivadas)."""
+    ids = [m["id"] for m in items]
+    if after is not None:
+        i = ids.index(after) + 1 if after in ids else len(items)
+        return items[i:i + limit]
+    if before is not None:
+        fim = ids.index(before) if before in ids else 0
+    else:
+        fim = len(items)
+    return items[max(0, fim - limit):fim]
+
+
 @app.get("/conversas")
-async def listar_conversas(user: dict = Depends(get_current_user)):
+async def listar_conversas(
+    agente_id: Optional[int] = None,
+    limit: int = Query(PAGE_DEFAULT, ge=1, le=PAGE_MAX),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    user: dict = Depends(get_current_user),
+):
+    """Conversas do user, mais recentes primeiro (`before` = mais antigas que o cursor)."""
+    _validar_cursor(before, after)
+    cond, ordem, cparams = _keyset_sql("conversas", "created_at", before, after, alias="c.")
+    filtro_agente = "AND c.agente_id = ?" if agente_id is not None else ""
+    params = (user["user_id"],) + ((agente_id,) if agente_id is not None else ()) + cparams
     conn = get_db()
     conversas = conn.execute(
-        """
+        f"""
         SELECT c.id, c.agente_id, a.nome as agente_nome, c.created_at
         FROM conversas c
         JOIN agentes a ON a.id = c.agente_id
-        WHERE c.user_id = ?
-        ORDER BY c.created_at DESC
+        WHERE c.user_id = ? {filtro_agente} {cond}
+        ORDER BY {ordem}
+        LIMIT ?
         """,
-        (user["user_id"],),
+        params + (limit,),
     ).fetchall()
     conn.close()
+    if after is not None:
+        conversas = list(reversed(conversas))
     return [
         {
             "id": c["id"],
@@ -141,23 +258,112 @@ async def listar_conversas(user: dict = Depends(get_current_user)):
     ]
 
 
-@app.get("/conversas/{conversa_id}/mensagens")
-async def listar_mensagens(conversa_id: int, user: dict = Depends(get_current_user)):
-    conn = get_db()
+def _verificar_conversa(conn, conversa_id: int, user_id: int):
     conversa = conn.execute(
         "SELECT * FROM conversas WHERE id = ? AND user_id = ?",
-        (conversa_id, user["user_id"]),
+        (conversa_id, user_id),
     ).fetchone()
     if not conversa:
         conn.close()
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
+    return conversa
 
-    msgs = conn.execute(
-        "SELECT role, content, timestamp FROM mensagens WHERE conversa_id = ? ORDER BY timestamp",
-        (conversa_id,),
-    ).fetchall()
+
+@app.get("/conversas/{conversa_id}/mensagens")
+async def listar_mensagens(
+    conversa_id: int,
+    limit: int = Query(PAGE_DEFAULT, ge=1, le=PAGE_MAX),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    user: dict = Depends(get_current_user),
+):
+    """Página de mensagens por ordem cronológica (sem cursor: as últimas `limit`)."""
+    _validar_cursor(before, after)
+    conn = get_db()
+    _verificar_conversa(conn, conversa_id, user["user_id"])
+
+    arquivada = conn.execute("SELECT 1 FROM mensagens_arquivo WHERE conversa_id = ?", (conversa_id,)).fetchone()
+    if arquivada:
+        # Conversa arquivada: descomprime e pagina em memória
+        msgs = _keyset_lista(archive.mensagens_da_conversa(conn, conversa_id), limit, before, after)
+    else:
+        cond, ordem, cparams = _keyset_sql("mensagens", "timestamp", before, after)
+        msgs = conn.execute(
+            f"""
+            SELECT id, role, content, timestamp FROM mensagens
+            WHERE conversa_id = ? {cond}
+            ORDER BY {ordem}
+            LIMIT ?
+            """,
+            (conversa_id,) + cparams + (limit,),
+        ).fetchall()
+        if after is None:
+            msgs = list(reversed(msgs))
+    conn.close()
+    return [
+        {"id": m["id"], "role": m["role"], "content": m["content"], "timestamp": m["timestamp"]}
+        for m in msgs
+    ]
+
+
+EXPORT_CHUNK = 500
+
+
+@app.get("/conversas/{conversa_id}/mensagens/export")
+async def exportar_mensagens(conversa_id: int, user: dict = Depends(get_current_user)):
+    """Histórico completo em NDJSON, lido e enviado aos blocos (memória constante)."""
+    conn = get_db()
+    _verificar_conversa(conn, conversa_id, user["user_id"])
+
+    def _linhas():
+        try:
+            for m in archive.mensagens_arquivadas(conn, conversa_id):
+                yield json.dumps(m, ensure_ascii=False) + "\n"
+            cursor = conn.execute(
+                "SELECT id, role, content, timestamp FROM mensagens WHERE conversa_id = ? ORDER BY timestamp, id",
+                (conversa_id,),
+            )
+            while rows := cursor.fetchmany(EXPORT_CHUNK):
+                yield "".join(json.dumps(dict(m), ensure_ascii=False) + "\n" for m in rows)
+        finally:
+            conn.close()
+
+    return StreamingResponse(
+        _linhas(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="conversa-{conversa_id}.ndjson"'},
+    )
+
+
+@app.get("/pesquisa")
+async def pesquisar(
+    q: str = Query(..., min_length=1, max_length=500),
+    tipo: str = Query("todos", pattern="^(todos|mensagens|dashboards)$"),
+    limit: int = Query(20, ge=1, le=pesquisa.LIMITE_MAX),
+    offset: int = Query(0, ge=0),
+    antes_mensagens: Optional[int] = Query(None, description="Cursor `antes` devolvido em mensagens"),
+    antes_dashboards: Optional[int] = Query(None, description="Cursor `antes` devolvido em dashboards"),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Pesquisa de texto nas conversas e dashboards do user, por relevância (BM25).
+    Ordena as JANELA_RANK ocorrências mais recentes: offset + limit não pode passar
+    dessa janela; para ir mais atrás usa-se o cursor `antes` devolvido por cada tipo
+    (rowids de índices diferentes, por isso um parâmetro para cada).
+    """
+    if offset + limit > pesquisa.JANELA_RANK:
+        raise HTTPException(
+            status_code=422,
+            detail=f"offset + limit não pode passar de {pesquisa.JANELA_RANK}: usa o cursor antes",
+        )
+    conn = get_db()
+    resultado = {}
+    if tipo in ("todos", "mensagens"):
+        resultado["mensagens"] = pesquisa.pesquisar_mensagens(conn, user["user_id"], q, limit, offset, antes_mensagens)
+    if tipo in ("todos", "dashboards"):
+        resultado["dashboards"] = pesquisa.pesquisar_dashboards(conn, user["user_id"], q, limit, offset, antes_dashboards)
     conn.close()
-    return [{"role": m["role"], "content": m["content"], "timestamp": m["timestamp"]} for m in msgs]
+    return resultado
 
 
 @app.post("/conversas/{conversa_id}/mensagens")
@@ -166,8 +372,35 @@ async def enviar_mensagem(
     body: MensagemRequest,
     user: dict = Depends(get_current_user),
 ):
-    return StreamingResponse(
+    conn = get_db()
+    _verificar_conversa(conn, conversa_id, user["user_id"])
+    conn.close()
+    # A geração corre numa task própria: uma ligação perdida não a interrompe
+    turno = streams.iniciar(
+        user["user_id"], conversa_id,
         process_message(user["user_id"], conversa_id, body.content),
+    )
+    if not turno:
+        raise HTTPException(status_code=409, detail="Já existe uma resposta em curso nesta conversa")
+    return StreamingResponse(
+        turno.subscrever(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/conversas/{conversa_id}/stream")
+async def retomar_stream(
+    conversa_id: int,
+    last_event_id: Optional[str] = Header(default=None),
+    user: dict = Depends(get_current_user),
+):
+    """Retoma o turno atual: reenvia os eventos após Last-Event-ID e segue o tail ao vivo."""
+    turno = streams.obter(user["user_id"], conversa_id)
+    if not turno:
+        raise HTTPException(status_code=404, detail="Sem resposta em curso para retomar")
+    return StreamingResponse(
+        turno.subscrever(last_event_id),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -175,79 +408,161 @@ async def enviar_mensagem(
 
 # --- Dashboards ---
 
-DASHBOARD_TEMPLATE = """<!DOCTYPE html>
-<html lang="pt">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{titulo} — QHub</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.7/dist/chart.umd.min.js"></script>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; background: #f5f5f5; color: #1a1a1a; }}
-        .dashboard-header {{ background: #1a1a2e; color: #fff; padding: 20px 32px; }}
-        .dashboard-header h1 {{ font-size: 22px; font-weight: 600; }}
-        .dashboard-header .meta {{ font-size: 13px; opacity: 0.7; margin-top: 4px; }}
-        .dashboard-body {{ max-width: 1200px; margin: 24px auto; padding: 0 24px; }}
-        .dashboard-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 20px; margin-bottom: 24px; }}
-        .dashboard-row {{ display: flex; gap: 20px; flex-wrap: wrap; margin-bottom: 24px; }}
-        .kpi-card {{ background: linear-gradient(135deg, #1a1a2e, #16213e); color: #fff; border-radius: 12px; padding: 24px; flex: 1; min-width: 180px; }}
-        .kpi-card h3 {{ font-size: 12px; text-transform: uppercase; letter-spacing: 0.5px; opacity: 0.8; margin-bottom: 8px; }}
-        .kpi-card .value {{ font-size: 36px; font-weight: 700; }}
-        .kpi-card .unit {{ font-size: 14px; opacity: 0.7; margin-left: 4px; }}
-        .kpi-card .variation {{ font-size: 12px; margin-top: 8px; opacity: 0.8; }}
-        .chart-container {{ background: #fff; border: 1px solid #e0e0e0; border-radius: 12px; padding: 20px; }}
-        .chart-container h3 {{ font-size: 15px; font-weight: 600; margin-bottom: 16px; color: #1a1a2e; }}
-        .chart-container canvas {{ max-height: 350px; }}
-        .data-table {{ background: #fff; border: 1px solid #e0e0e0; border-radius: 12px; padding: 20px; overflow-x: auto; }}
-        .data-table h3 {{ font-size: 15px; font-weight: 600; margin-bottom: 16px; color: #1a1a2e; }}
-        .data-table table {{ width: 100%; border-collapse: collapse; font-size: 14px; }}
-        .data-table th {{ background: #f5f7fa; padding: 10px 14px; text-align: left; font-weight: 600; border-bottom: 2px solid #e0e0e0; color: #555; }}
-        .data-table td {{ padding: 10px 14px; border-bottom: 1px solid #f0f0f0; }}
-        .data-table tr:hover td {{ background: #f8f9fa; }}
-        .section-title {{ font-size: 18px; font-weight: 600; margin: 32px 0 16px; color: #1a1a2e; }}
-    </style>
-</head>
-<body>
-    <div class="dashboard-header">
-        <h1>{titulo}</h1>
-        <div class="meta">Gerado em {created_at} — QHub Qualidade Industrial</div>
-    </div>
-    <div class="dashboard-body">
-        {html}
-    </div>
-    <script>
-        // Report height to parent for iframe auto-resize
-        function reportHeight() {{
-            var h = document.documentElement.scrollHeight;
-            window.parent.postMessage({{type: 'dashboard-height', height: h}}, '*');
-        }}
-        window.addEventListener('load', reportHeight);
-        window.addEventListener('resize', reportHeight);
-        new MutationObserver(reportHeight).observe(document.body, {{childList: true, subtree: true}});
-        setTimeout(reportHeight, 500);
-        setTimeout(reportHeight, 1500);
-    </script>
-</body>
-</html>"""
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+
+def _aceita_gzip(accept_encoding: str) -> bool:
+    """gzip aceite no Accept-Encoding com q > 0 (`gzip;q=0` recusa; `*` vale para gzip)."""
+    qs = {}
+    for parte in accept_encoding.split(","):
+        nome, *params = [p.strip() for p in parte.split(";")]
+        q = 1.0
+        for param in params:
+            chave, _, valor = param.partition("=")
+            if chave.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        qs[nome.lower()] = q
+    for nome in ("gzip", "x-gzip", "*"):
+        if nome in qs:
+            return qs[nome] > 0
+    return False
+
+
+def _resposta_comprimida(
+    request: Request, gz: bytes | None, etag: str, media_type: str, cache_control: str,
+    conteudo: bytes | None = None,
+) -> Response:
+    """
+    Serve bytes pré-comprimidos com ETag forte, 304 e negociação gzip. As duas
+    representações têm validadores distintos: "<hash>" (identity) e "<hash>-gz".
+    """
+    usar_gz = gz is not None and _aceita_gzip(request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": f'"{etag}-gz"' if usar_gz else f'"{etag}"',
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    # Comparação fraca (RFC 9110 §13.1.2); qualquer das duas variantes está atual
+    variantes = {f'"{etag}"'} | ({f'"{etag}-gz"'} if gz is not None else set())
+    pedidas = {t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")}
+    if "*" in pedidas or variantes & pedidas:
+        if headers["ETag"] not in pedidas and "*" not in pedidas:
+            headers["ETag"] = (variantes & pedidas).pop()
+        return Response(status_code=304, headers=headers)
+    if usar_gz:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=gz, media_type=media_type, headers=headers)
+    if conteudo is None:
+        conteudo = gzip.decompress(gz)
+    return Response(content=conteudo, media_type=media_type, headers=headers)
 
 
 @app.get("/dashboards/{dashboard_id}")
-async def ver_dashboard(dashboard_id: str):
-    conn = get_db()
-    dash = conn.execute(
-        "SELECT * FROM dashboards WHERE id = ?", (dashboard_id,)
-    ).fetchone()
-    conn.close()
-    if not dash:
-        raise HTTPException(status_code=404, detail="Dashboard não encontrado")
+async def ver_dashboard(dashboard_id: str, request: Request):
+    pagina = dashboards.cache.get(dashboard_id)
+    if pagina is None:
+        conn = get_db()
+        row = conn.execute(
+            "SELECT etag, gzip FROM dashboard_paginas WHERE dashboard_id = ?", (dashboard_id,)
+        ).fetchone()
+        if row:
+            pagina = (row["etag"], row["gzip"])
+        else:
+            # Dashboards anteriores ao pré-render: renderizar e guardar uma vez
+            dash = conn.execute(
+                "SELECT * FROM dashboards WHERE id = ?", (dashboard_id,)
+            ).fetchone()
+            if not dash:
+                conn.close()
+                raise HTTPException(status_code=404, detail="Dashboard não encontrado")
+            gz, etag = dashboards.comprimir_pagina(dashboards.render_pagina(
+                dashboard_id, dash["titulo"], archive.html_dashboard(dash), dash["created_at"],
+                live=bool(dash["widgets"]),
+            ))
+            conn.execute(
+                "INSERT OR REPLACE INTO dashboard_paginas (dashboard_id, etag, gzip) VALUES (?, ?, ?)",
+                (dashboard_id, etag, gz),
+            )
+            conn.commit()
+            pagina = (etag, gz)
+        conn.close()
+        dashboards.cache.put(dashboard_id, pagina)
+
+    etag, gz = pagina
+    return _resposta_comprimida(request, gz, etag, "text/html; charset=utf-8", CACHE_IMUTAVEL)
 
-    page = DASHBOARD_TEMPLATE.format(
-        titulo=dash["titulo"],
-        html=dash["html"],
-        created_at=dash["created_at"][:16].replace("T", " "),
+
+@app.get("/dashboards/{dashboard_id}/data")
+async def dados_dashboard(dashboard_id: str):
+    """Resultados atuais dos widgets de um dashboard vivo (sem chamar o modelo)."""
+    widgets = dashboards.widgets_cache.get(dashboard_id)
+    if widgets is None:
+        conn = get_db()
+        dash = conn.execute("SELECT widgets FROM dashboards WHERE id = ?", (dashboard_id,)).fetchone()
+        conn.close()
+        if not dash:
+            raise HTTPException(status_code=404, detail="Dashboard não encontrado")
+        widgets = json.loads(dash["widgets"]) if dash["widgets"] else []
+        dashboards.widgets_cache.put(dashboard_id, widgets)
+    # O iframe é sandboxed (origem null): precisa de CORS para ler a resposta
+    return JSONResponse(
+        content=avaliar_widgets(widgets),
+        headers={"Cache-Control": "no-cache", "Access-Control-Allow-Origin": "*"},
+    )
+
+
+# --- Exportação de defeitos ---
+
+_EXPORT_PARAMS = {"formato", "agrupar", "data_de", "data_ate"}
+
+
+def _streaming_exportacao(p: dict) -> StreamingResponse:
+    return StreamingResponse(
+        exportar.gerar(p),
+        media_type=exportar.FORMATOS[p["formato"]],
+        headers={"Content-Disposition": f'attachment; filename="{exportar.nome_ficheiro(p)}"'},
     )
-    return HTMLResponse(content=page)
+
+
+@app.get("/defeitos/export")
+async def exportar_defeitos(
+    request: Request,
+    formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    agrupar: str = Query("", description="Colunas separadas por vírgula"),
+    data_de: Optional[str] = None,
+    data_ate: Optional[str] = None,
+    user: dict = Depends(get_current_user),
+):
+    """
+    Defeitos filtrados (ou contagens por grupo) em CSV/NDJSON, aos blocos.
+    Os restantes parâmetros são filtros por coluna: ?turno=noite&tipo_defeito=lixo,crateras
+    """
+    filtros = {}
+    for nome, valor in request.query_params.multi_items():
+        if nome not in _EXPORT_PARAMS:
+            filtros.setdefault(nome, []).extend(v for v in valor.split(",") if v)
+    try:
+        p = exportar.pedido(formato, filtros, [c for c in agrupar.split(",") if c], data_de, data_ate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _streaming_exportacao(p)
+
+
+@app.get("/defeitos/export/{token}")
+async def download_exportacao(token: str):
+    """Link assinado devolvido pela tool exportar_defeitos (curta duração, sem header de auth)."""
+    payload = verificar_exportacao(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Link de exportação inválido ou expirado")
+    try:
+        # As colunas podem ter mudado desde a assinatura (novo CSV)
+        p = exportar.pedido(**payload["pedido"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _streaming_exportacao(p)
 
 
 # --- Admin dependency ---
@@ -287,6 +602,7 @@ async def admin_criar_agente(body: AgenteRequest, user: dict = Depends(require_a
     conn.commit()
     agente_id = cursor.lastrowid
     conn.close()
+    cache.agentes.invalidar()
     return {"id": agente_id, "nome": body.nome}
 
 
@@ -303,6 +619,7 @@ async def admin_atualizar_agente(agente_id: int, body: AgenteRequest, user: dict
     )
     conn.commit()
     conn.close()
+    cache.agentes.invalidar()
     return {"status": "ok"}
 
 
@@ -313,18 +630,28 @@ async def admin_apagar_agente(agente_id: int, user: dict = Depends(require_admin
     if not existing:
         conn.close()
         raise HTTPException(status_code=404, detail="Agente não encontrado")
-    # Cascata: remover associações, conversas e mensagens
-    conversa_ids = conn.execute("SELECT id FROM conversas WHERE agente_id = ?", (agente_id,)).fetchall()
-    for c in conversa_ids:
-        conn.execute("DELETE FROM mensagens WHERE conversa_id = ?", (c["id"],))
-    conn.execute("DELETE FROM conversas WHERE agente_id = ?", (agente_id,))
-    conn.execute("DELETE FROM user_agentes WHERE agente_id = ?", (agente_id,))
-    conn.execute("DELETE FROM agentes WHERE id = ?", (agente_id,))
-    conn.commit()
+    # Cascata via ON DELETE CASCADE; donos com muito histórico apagam em background
+    total = jobs.contar_mensagens(conn, "agente", agente_id)
+    if total > jobs.LIMIAR:
+        conn.close()
+        job = jobs.apagar_em_background("agente", agente_id, total)
+        return JSONResponse(status_code=202, content={"status": "em_curso", "job_id": job["id"]})
+    jobs.apagar(conn, "agente", agente_id)
     conn.close()
+    cache.agentes.invalidar()
     return {"status": "ok"}
 
 
+# --- Admin: Jobs ---
+
+@app.get("/admin/jobs/{job_id}")
+async def admin_ver_job(job_id: str, user: dict = Depends(require_admin)):
+    job = jobs.obter(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
 # --- Admin: Tools ---
 
 @app.get("/admin/tools")
@@ -358,7 +685,7 @@ async def admin_criar_user(body: UserRequest, user: dict = Depends(require_admin
     if existing:
         conn.close()
         raise HTTPException(status_code=409, detail="Email já registado")
-    pw_hash = bcrypt.hashpw(body.password.encode(), bcrypt.gensalt()).decode()
+    pw_hash = await hash_password(body.password)
     cursor = conn.execute(
         "INSERT INTO users (nome, email, password_hash, role) VALUES (?, ?, ?, ?)",
         (body.nome, body.email, pw_hash, body.role),
@@ -369,6 +696,38 @@ async def admin_criar_user(body: UserRequest, user: dict = Depends(require_admin
     return {"id": user_id, "nome": body.nome, "email": body.email, "role": body.role}
 
 
+@app.post("/admin/users/bulk")
+async def admin_criar_users(body: list[UserRequest], user: dict = Depends(require_admin)):
+    """Cria vários users de uma vez: os hashes correm em paralelo no pool de bcrypt."""
+    erros = []
+    emails = set()
+    validos = []
+    conn = get_db()
+    for u in body:
+        if not u.password:
+            erros.append({"email": u.email, "detail": "Password obrigatória para criar user"})
+        elif u.email in emails or conn.execute("SELECT 1 FROM users WHERE email = ?", (u.email,)).fetchone():
+            erros.append({"email": u.email, "detail": "Email já registado"})
+        else:
+            emails.add(u.email)
+            validos.append(u)
+    conn.close()
+
+    hashes = await asyncio.gather(*(hash_password(u.password) for u in validos))
+
+    conn = get_db()
+    criados = []
+    for u, pw_hash in zip(validos, hashes):
+        cursor = conn.execute(
+            "INSERT INTO users (nome, email, password_hash, role) VALUES (?, ?, ?, ?)",
+            (u.nome, u.email, pw_hash, u.role),
+        )
+        criados.append({"id": cursor.lastrowid, "nome": u.nome, "email": u.email, "role": u.role})
+    conn.commit()
+    conn.close()
+    return {"criados": criados, "erros": erros}
+
+
 @app.put("/admin/users/{user_id}")
 async def admin_atualizar_user(user_id: int, body: UserRequest, user: dict = Depends(require_admin)):
     conn = get_db()
@@ -382,7 +741,7 @@ async def admin_atualizar_user(user_id: int, body: UserRequest, user: dict = Dep
         conn.close()
         raise HTTPException(status_code=409, detail="Email já registado por outro user")
     if body.password:
-        pw_hash = bcrypt.hashpw(body.password.encode(), bcrypt.gensalt()).decode()
+        pw_hash = await hash_password(body.password)
         conn.execute(
             "UPDATE users SET nome = ?, email = ?, password_hash = ?, role = ? WHERE id = ?",
             (body.nome, body.email, pw_hash, body.role, user_id),
@@ -406,16 +765,16 @@ async def admin_apagar_user(user_id: int, user: dict = Depends(require_admin)):
     if not existing:
         conn.close()
         raise HTTPException(status_code=404, detail="User não encontrado")
-    # Cascata
-    conversa_ids = conn.execute("SELECT id FROM conversas WHERE user_id = ?", (user_id,)).fetchall()
-    for c in conversa_ids:
-        conn.execute("DELETE FROM mensagens WHERE conversa_id = ?", (c["id"],))
-    conn.execute("DELETE FROM conversas WHERE user_id = ?", (user_id,))
-    conn.execute("DELETE FROM user_agentes WHERE user_id = ?", (user_id,))
-    conn.execute("DELETE FROM dashboards WHERE user_id = ?", (user_id,))
-    conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
+    # Cascata via ON DELETE CASCADE; donos com muito histórico apagam em background
+    total = jobs.contar_mensagens(conn, "user", user_id)
+    if total > jobs.LIMIAR:
+        conn.close()
+        job = jobs.apagar_em_background("user", user_id, total)
+        return JSONResponse(status_code=202, content={"status": "em_curso", "job_id": job["id"]})
+    jobs.apagar(conn, "user", user_id)
     conn.close()
+    dashboards.invalidar()
+    cache.agentes.invalidar()
     return {"status": "ok"}
 
 
@@ -441,8 +800,26 @@ async def admin_set_user_agentes(user_id: int, body: UserAgentesRequest, user: d
         conn.execute("INSERT INTO user_agentes (user_id, agente_id) VALUES (?, ?)", (user_id, aid))
     conn.commit()
     conn.close()
+    cache.agentes.invalidar()
     return {"status": "ok"}
 
 
 # --- Serve frontend ---
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
+
+@app.get("/")
+@app.get("/index.html")
+async def index(request: Request):
+    # Sempre revalidado (304 se não mudou): é ele que aponta para os assets com hash
+    pagina = assets.index()
+    return _resposta_comprimida(request, pagina.gz, pagina.etag, pagina.media_type, "no-cache", pagina.conteudo)
+
+
+@app.get("/assets/{caminho:path}")
+async def ver_asset(caminho: str, request: Request):
+    asset, imutavel = assets.resolver(caminho)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Ficheiro não encontrado")
+    return _resposta_comprimida(
+        request, asset.gz, asset.etag, asset.media_type,
+        CACHE_IMUTAVEL if imutavel else "no-cache", asset.conteudo,
+    )
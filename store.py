@@ -0,0 +1,248 @@
+"""
+Store de defeitos partilhado entre workers: snapshot binário colunar (colunas
+codificadas por dicionário) lido por mmap. Com N workers as páginas ficam uma só
+vez na page cache do SO, em vez de N cópias da lista de dicts do CSV.
+
+Formato do snapshot (`QHUB_SNAPSHOT_PATH`, por omissão `<csv>.snap`):
+
+    MAGIC | u32 tamanho do cabeçalho | cabeçalho JSON | colunas (alinhadas a 8 bytes)
+
+O cabeçalho traz a origem (mtime/tamanho do CSV), o nº de linhas, o dicionário de
+cada coluna e os agregados já calculados. Se o CSV mudar, o primeiro worker a
+reparar reconstrói o snapshot (com lock de ficheiro); os outros esperam e abrem-no.
+
+    python store.py            # (re)constrói o snapshot
+"""
+
+import csv
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import Counter
+
+from db import file_lock
+
+DATA_PATH = os.environ.get("QHUB_DATA_PATH", os.path.join(os.path.dirname(__file__), "data", "defeitos.csv"))
+SNAPSHOT_PATH = os.environ.get("QHUB_SNAPSHOT_PATH", os.path.splitext(DATA_PATH)[0] + ".snap")
+
+MAGIC = b"QHUBSNP1"
+DICT_MAX = 65536  # Acima disto uma coluna de inteiros guarda os valores em vez de um dicionário
+LOTE = 65536  # Linhas lidas do CSV de cada vez (o trabalho é feito por coluna)
+_TIPOS = ("B", "H", "I")  # Códigos de dicionário, do mais pequeno ao maior
+
+
+class _Coluna:
+    """Acumula uma coluna do CSV como códigos de dicionário (ou inteiros crus)."""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.dicionario = {}
+        self.codigos = array("B")
+        self.inteiros = True  # Todos os valores vistos são inteiros canónicos
+        self.modo = "dict"
+
+    def juntar(self, valores: tuple):
+        """Acrescenta um lote de valores (os códigos seguem a ordem de 1ª ocorrência)."""
+        if self.modo == "int":
+            try:
+                inteiros = list(map(int, valores))
+                if tuple(map(str, inteiros)) == valores:
+                    self.codigos.extend(inteiros)
+                    return
+            except (ValueError, OverflowError):
+                pass
+            self._para_dicionario()
+        dicionario = self.dicionario
+        for v in dict.fromkeys(valores):
+            if v not in dicionario:
+                dicionario[v] = len(dicionario)
+                self.inteiros = self.inteiros and _inteiro(v) is not None
+        while len(dicionario) - 1 >= 1 << (8 * self.codigos.itemsize):
+            self.codigos = array(_TIPOS[_TIPOS.index(self.codigos.typecode) + 1], self.codigos)
+        if len(dicionario) > DICT_MAX and self.inteiros:
+            self._para_inteiros()
+            self.codigos.extend(map(int, valores))
+            return
+        self.codigos.extend(map(dicionario.__getitem__, valores))
+
+    def _para_inteiros(self):
+        valores = [int(v) for v in self.dicionario]
+        self.codigos = array("q", map(valores.__getitem__, self.codigos))
+        self.dicionario = {}
+        self.modo = "int"
+
+    def _para_dicionario(self):
+        inteiros = self.codigos
+        self.dicionario, self.codigos, self.modo = {}, array("B"), "dict"
+        self.inteiros = False
+        self.juntar(tuple(map(str, inteiros)))
+
+
+def _inteiro(valor: str):
+    try:
+        n = int(valor)
+    except ValueError:
+        return None
+    return n if str(n) == valor and -(1 << 63) <= n < 1 << 63 else None
+
+
+def _alinhar(n: int) -> int:
+    return (n + 7) & ~7
+
+
+# --- Construção ---
+
+
+def construir(data_path: str = DATA_PATH, snapshot_path: str = SNAPSHOT_PATH) -> "DefectStore":
+    """Lê o CSV, grava o snapshot (escrita atómica) e devolve-o aberto."""
+    st = os.stat(data_path)
+    por_tipo = Counter()
+    por_turno = {}
+    with open(data_path, newline="", encoding="utf-8") as f:
+        leitor = csv.reader(f)
+        nomes = next(leitor)
+        colunas = [_Coluna(n) for n in nomes]
+        i_tipo, i_turno = nomes.index("tipo_defeito"), nomes.index("turno")
+        n = 0
+        while lote := list(itertools.islice(leitor, LOTE)):
+            valores = list(zip(*lote))
+            for coluna, v in zip(colunas, valores):
+                coluna.juntar(v)
+            # Counter preserva a ordem de 1ª ocorrência, como o cálculo original
+            # linha a linha (importa para os desempates do most_common)
+            por_tipo.update(valores[i_tipo])
+            for (turno, tipo), c in Counter(zip(valores[i_turno], valores[i_tipo])).items():
+                por_turno.setdefault(turno, Counter())[tipo] += c
+            n += len(lote)
+
+    offset = 0
+    meta = []
+    for c in colunas:
+        meta.append({
+            "nome": c.nome,
+            "modo": c.modo,
+            "typecode": c.codigos.typecode,
+            "offset": offset,
+            "dicionario": list(c.dicionario) if c.modo == "dict" else None,
+        })
+        offset = _alinhar(offset + len(c.codigos) * c.codigos.itemsize)
+    cabecalho = json.dumps({
+        "origem": [st.st_mtime_ns, st.st_size],
+        "byteorder": sys.byteorder,
+        "linhas": n,
+        "colunas": meta,
+        "agregados": {
+            "total": n,
+            "por_tipo": dict(por_tipo),
+            "por_turno": {t: dict(c) for t, c in por_turno.items()},
+        },
+    }, ensure_ascii=False).encode()
+
+    # As colunas vão diretamente dos arrays para o ficheiro (sem cópia intermédia)
+    prefixo = MAGIC + struct.pack("<I", len(cabecalho)) + cabecalho
+    partes = [prefixo + bytes(_alinhar(len(prefixo)) - len(prefixo))]
+    for c in colunas:
+        tamanho = len(c.codigos) * c.codigos.itemsize
+        partes += [c.codigos, bytes(_alinhar(tamanho) - tamanho)]
+
+    tmp = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            for parte in partes:
+                f.write(parte)
+        os.replace(tmp, snapshot_path)
+    except OSError as e:
+        # Diretório só de leitura: o worker fica com o snapshot em memória
+        print(f"store: não foi possível gravar {snapshot_path}: {e}")
+        return DefectStore(b"".join(partes))
+    del partes, colunas
+    return abrir(snapshot_path)
+
+
+# --- Leitura ---
+
+
+class DefectStore:
+    """Vista só de leitura sobre um snapshot (mmap ou bytes em memória)."""
+
+    def __init__(self, buf):
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError("snapshot inválido")
+        (tamanho,) = struct.unpack_from("<I", buf, len(MAGIC))
+        cabecalho = json.loads(bytes(buf[len(MAGIC) + 4:len(MAGIC) + 4 + tamanho]))
+        if cabecalho["byteorder"] != sys.byteorder:
+            raise ValueError("snapshot de outra arquitetura")
+        self._buf = buf
+        self.origem = tuple(cabecalho["origem"])
+        self.linhas = cabecalho["linhas"]
+        inicio = _alinhar(len(MAGIC) + 4 + tamanho)
+        vista = memoryview(buf)
+        self._colunas = {}
+        for m in cabecalho["colunas"]:
+            itemsize = array(m["typecode"]).itemsize
+            a = inicio + m["offset"]
+            self._colunas[m["nome"]] = (vista[a:a + self.linhas * itemsize].cast(m["typecode"]), m["dicionario"])
+        agg = cabecalho["agregados"]
+        self.agregados = {
+            "total": agg["total"],
+            "por_tipo": Counter(agg["por_tipo"]),
+            "por_turno": {t: Counter(c) for t, c in agg["por_turno"].items()},
+        }
+
+    @property
+    def colunas(self) -> list[str]:
+        return list(self._colunas)
+
+    def coluna(self, nome: str):
+        """(códigos, dicionário). Sem dicionário os códigos são os próprios valores."""
+        return self._colunas[nome]
+
+    def valor(self, nome: str, i: int) -> str:
+        codigos, dicionario = self._colunas[nome]
+        return dicionario[codigos[i]] if dicionario is not None else str(codigos[i])
+
+
+def abrir(snapshot_path: str = SNAPSHOT_PATH) -> DefectStore | None:
+    try:
+        with open(snapshot_path, "rb") as f:
+            return DefectStore(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        return None
+
+
+_atual = None
+_lock = threading.Lock()
+
+
+def _carregar(origem: tuple) -> DefectStore:
+    s = abrir()
+    if s is not None and s.origem == origem:
+        return s
+    # Um só worker reconstrói; os outros esperam pelo lock e abrem o resultado
+    with file_lock(SNAPSHOT_PATH + ".lock"):
+        s = abrir()
+        if s is not None and s.origem == origem:
+            return s
+        return construir()
+
+
+def obter() -> DefectStore:
+    """Store atual; recarrega quando o CSV muda (mtime/tamanho)."""
+    global _atual
+    st = os.stat(DATA_PATH)
+    origem = (st.st_mtime_ns, st.st_size)
+    if _atual is None or _atual.origem != origem:
+        with _lock:
+            if _atual is None or _atual.origem != origem:
+                _atual = _carregar(origem)
+    return _atual
+
+
+if __name__ == "__main__":
+    s = construir()
+    print(f"{SNAPSHOT_PATH}: {s.linhas} linhas, colunas {s.colunas}")
@@ -0,0 +1,106 @@
+"""
+Turnos de resposta desacoplados da ligação HTTP: buffer de eventos SSE com ids
+sequenciais e retoma via Last-Event-ID.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+
+BUFFER_SIZE = 2000  # Eventos guardados por turno (os mais antigos são descartados; ver subscrever)
+RETENCAO = 120  # Segundos que um turno terminado fica disponível para retoma
+
+
+class Turno:
+    """Um turno de geração: corre numa task própria e guarda os eventos emitidos."""
+
+    def __init__(self, user_id: int, conversa_id: int):
+        self.id = uuid.uuid4().hex[:8]
+        self.user_id = user_id
+        self.conversa_id = conversa_id
+        self.eventos = deque(maxlen=BUFFER_SIZE)  # (seq, chunk SSE, len(texto) antes do evento)
+        self.seq = 0
+        self.texto = ""  # Texto acumulado do turno (para o evento reset)
+        self.terminado = False
+        self.terminado_em = None
+        self._novo = asyncio.Condition()
+        self.task = None
+
+    async def _publicar(self, chunk: str):
+        async with self._novo:
+            self.seq += 1
+            self.eventos.append((self.seq, f"id: {self.id}:{self.seq}\n{chunk}", len(self.texto)))
+            if chunk.startswith('data: {"type": "text"'):
+                self.texto += json.loads(chunk[6:])["content"]
+            self._novo.notify_all()
+
+    async def _terminar(self):
+        async with self._novo:
+            self.terminado = True
+            self.terminado_em = time.monotonic()
+            self._novo.notify_all()
+
+    async def correr(self, gerador):
+        try:
+            async for chunk in gerador:
+                await self._publicar(chunk)
+        finally:
+            await self._terminar()
+
+    async def subscrever(self, last_event_id: str | None = None):
+        """Yield dos eventos a partir de last_event_id (exclusivo) e depois do tail ao vivo."""
+        ultimo = 0
+        if last_event_id:
+            turno_id, _, seq = last_event_id.partition(":")
+            if turno_id == self.id and seq.isdigit():
+                ultimo = int(seq)
+
+        while True:
+            async with self._novo:
+                pendentes = [chunk for seq, chunk, _ in self.eventos if seq > ultimo]
+                primeiro, _, n_texto = self.eventos[0] if self.eventos else (0, None, 0)
+                if ultimo < primeiro - 1:
+                    # Eventos a seguir a `ultimo` já saíram do buffer: em vez de um texto
+                    # com buracos, o cliente recebe todo o texto anterior ao buffer
+                    reset = json.dumps({"type": "reset", "texto": self.texto[:n_texto]}, ensure_ascii=False)
+                    pendentes.insert(0, f"id: {self.id}:{primeiro - 1}\ndata: {reset}\n\n")
+                if not pendentes:
+                    if self.terminado:
+                        return
+                    await self._novo.wait()
+                    continue
+                ultimo = self.seq
+            for chunk in pendentes:
+                yield chunk
+
+
+_turnos: dict[int, Turno] = {}  # conversa_id → turno mais recente
+
+
+def _limpar():
+    agora = time.monotonic()
+    for cid, t in list(_turnos.items()):
+        if t.terminado and agora - t.terminado_em > RETENCAO:
+            del _turnos[cid]
+
+
+def iniciar(user_id: int, conversa_id: int, gerador) -> Turno | None:
+    """Arranca o gerador numa task independente. Devolve None se já há um turno em curso."""
+    _limpar()
+    atual = _turnos.get(conversa_id)
+    if atual and not atual.terminado:
+        return None
+    turno = Turno(user_id, conversa_id)
+    turno.task = asyncio.create_task(turno.correr(gerador))
+    _turnos[conversa_id] = turno
+    return turno
+
+
+def obter(user_id: int, conversa_id: int) -> Turno | None:
+    _limpar()
+    turno = _turnos.get(conversa_id)
+    if not turno or turno.user_id != user_id:
+        return None
+    return turno
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Base de dados temporária (ainda por criar) para o teste."""
+    caminho = str(tmp_path / "qhub.db")
+    monkeypatch.setattr(db, "DB_PATH", caminho)
+    db.close_pool()  # O pool pode ter ligações a outra base de dados
+    yield caminho
+    db.close_pool()
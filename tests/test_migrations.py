@@ -0,0 +1,145 @@
+"""
+Migrações do schema: versão final, planos das consultas quentes (índices da
+migração 1) e upgrade de uma base de dados v0 criada com o schema original.
+
+    python -m pytest tests
+"""
+
+import sqlite3
+
+import pytest
+
+import db
+
+# Schema antes das migrações (user_version 0)
+SCHEMA_V0 = """
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL
+    );
+    CREATE TABLE agentes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        system_prompt TEXT NOT NULL,
+        tools TEXT NOT NULL
+    );
+    CREATE TABLE user_agentes (
+        user_id INTEGER,
+        agente_id INTEGER,
+        PRIMARY KEY (user_id, agente_id),
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (agente_id) REFERENCES agentes(id)
+    );
+    CREATE TABLE conversas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        agente_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (agente_id) REFERENCES agentes(id)
+    );
+    CREATE TABLE mensagens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversa_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        FOREIGN KEY (conversa_id) REFERENCES conversas(id)
+    );
+    CREATE TABLE dashboards (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        titulo TEXT NOT NULL,
+        html TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+"""
+
+# Consulta → índice que o plano tem de usar
+PLANOS = [
+    (
+        "SELECT id, role, content, timestamp FROM mensagens WHERE conversa_id = ? "
+        "ORDER BY timestamp DESC, id DESC LIMIT ?",
+        (1, 100),
+        "USING INDEX idx_mensagens_conversa_ts",
+    ),
+    (
+        "SELECT c.id, c.agente_id, a.nome, c.created_at FROM conversas c JOIN agentes a ON a.id = c.agente_id "
+        "WHERE c.user_id = ? ORDER BY c.created_at DESC, c.id DESC LIMIT ?",
+        (1, 100),
+        "USING COVERING INDEX idx_conversas_user_created",
+    ),
+    ("SELECT rowid FROM dashboards WHERE user_id = ? LIMIT ?", (1, 500), "idx_dashboards_user"),
+    ("SELECT id FROM conversas WHERE agente_id = ? LIMIT ?", (1, 500), "idx_conversas_agente"),
+]
+
+
+def _plano(conn, sql, params) -> str:
+    return " | ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_base_nova_fica_na_ultima_versao(db_path):
+    db.init_db()
+    conn = db.get_db()
+    assert db.schema_version(conn) == db.MIGRATIONS[-1][0]
+    conn.close()
+
+
+@pytest.mark.parametrize("sql,params,indice", PLANOS)
+def test_consultas_quentes_usam_indices(db_path, sql, params, indice):
+    db.init_db()
+    conn = db.get_db()
+    assert indice in _plano(conn, sql, params)
+    conn.close()
+
+
+def test_upgrade_de_v0(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA_V0)
+    conn.executescript("""
+        INSERT INTO users (nome, email, password_hash, role) VALUES ('Ana', 'ana@demo.com', 'x', 'admin');
+        INSERT INTO agentes (nome, system_prompt, tools) VALUES ('Qualidade', 'p', '[]');
+        INSERT INTO user_agentes VALUES (1, 1);
+        INSERT INTO conversas (user_id, agente_id, created_at) VALUES (1, 1, '2025-01-01T10:00:00');
+        INSERT INTO conversas (user_id, agente_id, created_at) VALUES (1, 1, '2025-01-02T10:00:00');
+        INSERT INTO conversas (user_id, agente_id, created_at) VALUES (1, 1, '2025-01-03T10:00:00');
+        INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (1, 'user', 'defeitos de crateras', '2025-01-01T10:00:01');
+        INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (1, 'assistant', 'ok', '2025-01-01T10:00:02');
+        INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (3, 'user', 'apagada', '2025-01-03T10:00:01');
+        INSERT INTO dashboards VALUES ('d1', 1, 'Pareto de crateras', '<p></p>', '2025-01-01T10:00:00');
+        -- A última conversa foi apagada: os ids 3 (conversa e mensagem) não podem voltar a ser usados
+        DELETE FROM mensagens WHERE conversa_id = 3;
+        DELETE FROM conversas WHERE id = 3;
+        -- Órfã (FK sem efeito antes da migração 3): fica de fora
+        INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (99, 'user', 'órfã', '2025-01-04T10:00:00');
+    """)
+    conn.commit()
+    sequencias = dict(conn.execute("SELECT name, seq FROM sqlite_sequence"))
+    conn.close()
+
+    db.init_db()
+    conn = db.get_db()
+    assert db.schema_version(conn) == db.MIGRATIONS[-1][0]
+    # Dados preservados e semente não aplicada (a base já tinha users)
+    assert [r["email"] for r in conn.execute("SELECT email FROM users")] == ["ana@demo.com"]
+    assert [r["id"] for r in conn.execute("SELECT id FROM conversas ORDER BY id")] == [1, 2]
+    assert [r["content"] for r in conn.execute("SELECT content FROM mensagens ORDER BY id")] == ["defeitos de crateras", "ok"]
+    assert not conn.execute("PRAGMA foreign_key_check").fetchall()
+    # AUTOINCREMENT mantém o máximo histórico depois de recriar as tabelas
+    novas = dict(conn.execute("SELECT name, seq FROM sqlite_sequence"))
+    assert novas["conversas"] == sequencias["conversas"]
+    assert novas["mensagens"] == sequencias["mensagens"]
+    # Índices e FTS da migração 8 preenchidos a partir dos dados existentes
+    for sql, params, indice in PLANOS:
+        assert indice in _plano(conn, sql, params)
+    assert conn.execute("SELECT COUNT(*) FROM mensagens_fts WHERE mensagens_fts MATCH 'crateras'").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM dashboards_fts WHERE dashboards_fts MATCH 'crateras'").fetchone()[0] == 1
+    # Apagar o user cascateia pelas FKs da migração 3
+    conn.execute("DELETE FROM users WHERE id = 1")
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM mensagens").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,150 @@
+"""
+Pesquisa de texto (GET /pesquisa): isolamento entre users, conversas arquivadas
+e paginação dentro da janela de ordenação (mais / antes).
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import archive
+import db
+import pesquisa
+import server
+
+# Users da semente: 1 Maria, 2 Rui
+MARIA, RUI = 1, 2
+
+
+@pytest.fixture
+def conn(db_path):
+    db.init_db()
+    conn = db.get_db()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def cliente():
+    """TestClient sem o startup (writer, jobs, pool de bcrypt): escritas diretas."""
+    estado = {"user_id": MARIA}
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"user_id": estado["user_id"], "role": "responsavel"}
+    c = TestClient(server.app)
+    c.como = lambda user_id: estado.update(user_id=user_id)
+    yield c
+    server.app.dependency_overrides.clear()
+
+
+def _conversa(conn, user_id: int, textos: list[str], timestamp: str = "2025-01-01T10:00:00") -> int:
+    conversa_id = conn.execute(
+        "INSERT INTO conversas (user_id, agente_id, created_at) VALUES (?, 1, ?)", (user_id, timestamp)
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO mensagens (conversa_id, role, content, timestamp) VALUES (?, 'user', ?, ?)",
+        [(conversa_id, t, timestamp) for t in textos],
+    )
+    conn.commit()
+    return conversa_id
+
+
+def _dashboard(conn, dashboard_id: str, user_id: int, titulo: str):
+    conn.execute(
+        "INSERT INTO dashboards (id, user_id, titulo, html, created_at) VALUES (?, ?, ?, '', '2025-01-01')",
+        (dashboard_id, user_id, titulo),
+    )
+    conn.commit()
+
+
+def _pesquisar(cliente, q: str, **params) -> dict:
+    r = cliente.get("/pesquisa", params={"q": q, **params})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_so_devolve_dados_do_proprio_user(conn, cliente):
+    da_maria = _conversa(conn, MARIA, ["crateras no rack R11", "segredo da maria"])
+    do_rui = _conversa(conn, RUI, ["crateras no rack R12", "segredo do rui"])
+    _dashboard(conn, "dm", MARIA, "Crateras da Maria")
+    _dashboard(conn, "dr", RUI, "Crateras do Rui")
+
+    r = _pesquisar(cliente, "crateras")
+    assert {m["conversa_id"] for m in r["mensagens"]["resultados"]} == {da_maria}
+    assert [d["dashboard_id"] for d in r["dashboards"]["resultados"]] == ["dm"]
+    # Termos que só existem nos dados de outro user não devolvem nada
+    assert _pesquisar(cliente, "segredo rui")["mensagens"]["resultados"] == []
+
+    cliente.como(RUI)
+    r = _pesquisar(cliente, "crateras")
+    assert {m["conversa_id"] for m in r["mensagens"]["resultados"]} == {do_rui}
+    assert [d["dashboard_id"] for d in r["dashboards"]["resultados"]] == ["dr"]
+
+
+def test_conversa_arquivada_continua_pesquisavel_e_sai_ao_apagar(conn, cliente):
+    conversa_id = _conversa(conn, MARIA, ["escorridos na posição 4"], timestamp="2020-01-01T10:00:00")
+    assert archive.arquivar_conversas(30) == 1
+    assert conn.execute("SELECT COUNT(*) FROM mensagens WHERE conversa_id = ?", (conversa_id,)).fetchone()[0] == 0
+
+    r = _pesquisar(cliente, "escorr*", tipo="mensagens")
+    assert [m["conversa_id"] for m in r["mensagens"]["resultados"]] == [conversa_id]
+    assert "«escorridos»" in r["mensagens"]["resultados"][0]["excerto"]
+
+    conn.execute("DELETE FROM conversas WHERE id = ?", (conversa_id,))
+    conn.commit()
+    assert _pesquisar(cliente, "escorridos", tipo="mensagens")["mensagens"]["resultados"] == []
+    assert conn.execute("SELECT COUNT(*) FROM mensagens_fts").fetchone()[0] == 0
+
+
+def _percorrer(cliente, tipo: str, limit: int) -> list:
+    """Todas as páginas de todas as janelas de um tipo, seguindo mais / antes."""
+    vistos, antes = [], None
+    while True:
+        offset = 0
+        while True:
+            params = {"tipo": tipo, "limit": limit, "offset": offset}
+            if antes is not None:
+                params[f"antes_{tipo}"] = antes
+            pagina = _pesquisar(cliente, "crateras", **params)[tipo]
+            vistos += pagina["resultados"]
+            if not pagina["mais"]:
+                break
+            offset += limit
+        if pagina["antes"] is None:
+            return vistos
+        antes = pagina["antes"]
+
+
+def test_janela_mais_e_antes(conn, cliente, monkeypatch):
+    monkeypatch.setattr(pesquisa, "JANELA_RANK", 6)
+    _conversa(conn, MARIA, [f"crateras {i}" for i in range(14)])
+    for i in range(7):
+        _dashboard(conn, f"d{i}", MARIA, f"Crateras {i}")
+
+    # Janela cheia: `mais` dentro da janela e cursor para a seguinte
+    r = _pesquisar(cliente, "crateras", tipo="mensagens", limit=3)["mensagens"]
+    assert len(r["resultados"]) == 3 and r["mais"] and r["antes"] is not None
+    r = _pesquisar(cliente, "crateras", tipo="mensagens", limit=3, offset=3)["mensagens"]
+    assert len(r["resultados"]) == 3 and not r["mais"]
+    # Para lá da janela é erro, não uma página vazia
+    assert cliente.get("/pesquisa", params={"q": "crateras", "limit": 3, "offset": 6}).status_code == 422
+
+    mensagens = _percorrer(cliente, "mensagens", 2)
+    assert len(mensagens) == len({m["mensagem_id"] for m in mensagens}) == 14
+    dashboards = _percorrer(cliente, "dashboards", 3)
+    assert sorted(d["dashboard_id"] for d in dashboards) == [f"d{i}" for i in range(7)]
+
+
+def test_cursores_separados_por_tipo(conn, cliente, monkeypatch):
+    monkeypatch.setattr(pesquisa, "JANELA_RANK", 5)
+    _conversa(conn, MARIA, [f"crateras {i}" for i in range(12)])
+    for i in range(7):
+        _dashboard(conn, f"d{i}", MARIA, f"Crateras {i}")
+
+    primeira = _pesquisar(cliente, "crateras", limit=5)
+    # Cada cursor só avança o seu tipo (são rowids de índices diferentes)
+    r = _pesquisar(cliente, "crateras", limit=5, antes_mensagens=primeira["mensagens"]["antes"])
+    assert r["dashboards"] == primeira["dashboards"]
+    ids = {m["mensagem_id"] for m in r["mensagens"]["resultados"]}
+    assert len(ids) == 5 and ids.isdisjoint(m["mensagem_id"] for m in primeira["mensagens"]["resultados"])
+
+    r = _pesquisar(cliente, "crateras", limit=5, antes_dashboards=primeira["dashboards"]["antes"])
+    assert r["mensagens"] == primeira["mensagens"]
+    assert {d["dashboard_id"] for d in r["dashboards"]["resultados"]} == {"d0", "d1"}
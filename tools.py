@@ -2,34 +2,28 @@
 Tools que consultam o CSV de defeitos de pintura e geram visualizações.
 """
 
-import csv
-import os
-from collections import Counter
+import exportar
+import store
 
-DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "defeitos.csv")
 
-
-def _ler_csv():
-    with open(DATA_PATH, newline="", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
+def _agregados():
+    """Contagens pré-calculadas no snapshot do store (refeito quando o CSV muda)."""
+    return store.obter().agregados
 
 
 def contar_defeitos(tipo_defeito=None):
     """Conta defeitos, opcionalmente filtrado por tipo."""
-    rows = _ler_csv()
+    agg = _agregados()
     if tipo_defeito:
-        count = sum(1 for r in rows if r["tipo_defeito"] == tipo_defeito)
-        return {"tipo_defeito": tipo_defeito, "total": count}
-    counter = Counter(r["tipo_defeito"] for r in rows)
-    return {"total": len(rows), "por_tipo": dict(counter.most_common())}
+        return {"tipo_defeito": tipo_defeito, "total": agg["por_tipo"].get(tipo_defeito, 0)}
+    return {"total": agg["total"], "por_tipo": dict(agg["por_tipo"].most_common())}
 
 
 def top_defeitos(n=5):
     """Devolve os N defeitos mais frequentes (Pareto)."""
-    rows = _ler_csv()
-    counter = Counter(r["tipo_defeito"] for r in rows)
-    top = counter.most_common(n)
-    total = len(rows)
+    agg = _agregados()
+    top = agg["por_tipo"].most_common(n)
+    total = agg["total"]
     return {
         "total_registos": total,
         "top": [
@@ -41,23 +35,30 @@ def top_defeitos(n=5):
 
 def defeitos_por_turno(turno=None):
     """Conta defeitos agrupados por turno. Pode filtrar por turno específico."""
-    rows = _ler_csv()
+    por_turno = _agregados()["por_turno"]
     if turno:
-        rows = [r for r in rows if r["turno"] == turno]
-    result = {}
-    for r in rows:
-        t = r["turno"]
-        if t not in result:
-            result[t] = Counter()
-        result[t][r["tipo_defeito"]] += 1
+        por_turno = {turno: por_turno[turno]} if turno in por_turno else {}
     return {
         "por_turno": {
             k: {"total": sum(v.values()), "defeitos": dict(v.most_common())}
-            for k, v in result.items()
+            for k, v in por_turno.items()
         }
     }
 
 
+def exportar_defeitos(formato: str = "csv", filtros: dict | None = None, agrupar: list | None = None,
+                      data_de: str | None = None, data_ate: str | None = None):
+    """
+    Prepara uma exportação (linhas filtradas ou contagens por grupo). Os dados não
+    voltam ao modelo: o agent_engine assina o pedido e devolve um link de download.
+    """
+    try:
+        p = exportar.pedido(formato, filtros, agrupar, data_de, data_ate)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"widget": "export", "pedido": p, "avisos": exportar.desconhecidos(p)}
+
+
 # --- Render tools (pass-through, interceptadas pelo agent_engine) ---
 
 
@@ -94,10 +95,15 @@ def gerar_kpi(titulo: str, valor: str, unidade: str = "", variacao: str = ""):
     }
 
 
-def gerar_dashboard(titulo: str, html: str):
-    """Gera um dashboard HTML completo acessível por link. O backend guarda e serve a página."""
+def gerar_dashboard(titulo: str, html: str, widgets: list | None = None):
+    """
+    Gera um dashboard HTML completo acessível por link. O backend guarda e serve a página.
+    `widgets` (opcional) declara as consultas por trás dos valores: o dashboard vai
+    buscá-los a /dashboards/{id}/data em vez de os ter fixos no HTML.
+    """
     return {
         "widget": "dashboard",
         "titulo": titulo,
         "html": html,
+        "widgets": widgets or [],
     }